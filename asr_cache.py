@@ -0,0 +1,96 @@
+import json
+import sqlite3
+import hashlib
+import threading
+
+
+class SQLiteStore(object):
+    """Base of the on-disk stores: one SQLite connection shared by threads.
+
+    The connection is opened with check_same_thread=False and every
+    statement runs under a lock. The database is put in WAL mode, the
+    `schema` statement creates its table if missing, and each write is
+    committed at once, so an interrupted run keeps everything it wrote.
+    """
+
+    schema = None
+
+    def __init__(self, path=':memory:'):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        with self.lock:
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute(self.schema)
+            self.conn.commit()
+
+    def fetchone(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchone()
+
+    def fetchall(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def write(self, sql, params=()):
+        """Run and commit one statement, returning its rowcount"""
+        with self.lock:
+            rowcount = self.conn.execute(sql, params).rowcount
+            self.conn.commit()
+        return rowcount
+
+    def write_many(self, sql, rows):
+        with self.lock:
+            self.conn.executemany(sql, rows)
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class HypothesisCache(SQLiteStore):
+    """Persistent store of ASR hypotheses backed by SQLite.
+
+    Entries are keyed by the AudioStore digest of the clip, the engine name
+    and a hash of the engine settings (ASR hints, sample rate, ...), so a
+    settings change never serves a stale transcript. Every entry is
+    committed as soon as it is written, which lets an interrupted run pick
+    up where it stopped.
+    """
+
+    schema = (
+        'CREATE TABLE IF NOT EXISTS hypotheses ('
+        'audio_hash TEXT NOT NULL, '
+        'engine TEXT NOT NULL, '
+        'settings_hash TEXT NOT NULL, '
+        'hypothesis TEXT NOT NULL, '
+        'PRIMARY KEY (audio_hash, engine, settings_hash))'
+    )
+
+    @staticmethod
+    def hash_settings(settings):
+        encoded = json.dumps(settings, sort_keys=True).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(self, audio_hash, engine, settings_hash):
+        row = self.fetchone(
+            'SELECT hypothesis FROM hypotheses '
+            'WHERE audio_hash = ? AND engine = ? AND settings_hash = ?',
+            (audio_hash, engine, settings_hash)
+        )
+        if row is None:
+            return None
+        return row[0]
+
+    def put(self, audio_hash, engine, settings_hash, hypothesis):
+        self.write(
+            'INSERT OR REPLACE INTO hypotheses VALUES (?, ?, ?, ?)',
+            (audio_hash, engine, settings_hash, hypothesis)
+        )
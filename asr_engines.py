@@ -0,0 +1,261 @@
+import io
+import ast
+import json
+import base64
+import threading
+from time import perf_counter
+from subprocess import PIPE, Popen
+
+import requests
+from pydub import AudioSegment
+from google.cloud import speech
+
+from capture_store import CaptureStore
+
+SAMPLE_RATE = 16000
+GOOGLE_LANGUAGE_CODE = "en-IN"
+
+ENGINE_TYPES = {}
+
+_speech_client = None
+_speech_client_lock = threading.Lock()
+
+# Engine names that can be listed in the config without a type
+BUILTIN_ENGINES = {
+    'google_speech': ('google_speech', {'use_asr_hints': False}),
+    'slang_google_speech': ('google_speech', {'use_asr_hints': True}),
+    'indic_conformer': ('indic_conformer', {}),
+    'indic_wav2vec': ('bhashini', {}),
+}
+
+
+def get_speech_client():
+    """The SpeechClient shared by every Google adapter.
+
+    Creating a client opens a new gRPC channel and authenticates, so it is
+    done once per process, on first use, and the client is reused by all
+    concurrent requests.
+    """
+    global _speech_client
+    with _speech_client_lock:
+        if _speech_client is None:
+            _speech_client = speech.SpeechClient()
+        return _speech_client
+
+
+def register_engine(engine_type):
+    """Class decorator registering an ASREngine subclass under engine_type"""
+    def wrap(cls):
+        ENGINE_TYPES[engine_type] = cls
+        return cls
+    return wrap
+
+
+class ASREngine(object):
+    """Base class of the ASR engine adapters.
+
+    An adapter is created once per run and shared by every worker, so it
+    owns its long-lived clients and must be thread-safe. Subclasses
+    implement `recognize` and `settings`; `transcribe` wraps `recognize`
+    with latency and failure counters, and records its results to, or
+    replays them from, the CaptureStore in `context['capture']`.
+    """
+
+    def __init__(self, name, context, **options):
+        self.name = name
+        self.context = context
+        self.options = options
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.total_latency = 0.0
+
+    def settings(self):
+        """Everything besides the audio that affects the engine's output"""
+        return {}
+
+    def recognize(self, content, url):
+        raise NotImplementedError
+
+    def capture_key(self, content):
+        return CaptureStore.asr_key(self.name, self.settings(), content)
+
+    def record(self, content, url, hypothesis):
+        """Write a result to the capture store of the context if recording"""
+        capture = self.context.get('capture')
+        if capture is not None and capture.recording:
+            capture.put(
+                'asr', self.capture_key(content), url.encode('utf-8'),
+                200, 'text/plain', hypothesis.encode('utf-8')
+            )
+
+    def replay(self, content, url):
+        exchange = self.context['capture'].get('asr', self.capture_key(content))   # noqa
+        if exchange is None:
+            raise LookupError(f"No captured {self.name} result for {url}")
+        return exchange[2].decode('utf-8')
+
+    def transcribe(self, content, url):
+        capture = self.context.get('capture')
+        start = perf_counter()
+        try:
+            if capture is not None and capture.replaying:
+                return self.replay(content, url)
+            hypothesis = self.recognize(content, url)
+            self.record(content, url, hypothesis)
+            return hypothesis
+        except Exception:
+            with self.lock:
+                self.failures += 1
+            raise
+        finally:
+            latency = perf_counter() - start
+            with self.lock:
+                self.calls += 1
+                self.total_latency += latency
+
+    def stats(self):
+        with self.lock:
+            mean = self.total_latency / self.calls if self.calls else 0.0
+            return {
+                'calls': self.calls,
+                'failures': self.failures,
+                'mean_latency': mean,
+            }
+
+
+@register_engine('google_speech')
+class GoogleSpeechEngine(ASREngine):
+    def __init__(self, name, context, use_asr_hints=False, **options):
+        super().__init__(name, context, **options)
+        self.use_asr_hints = use_asr_hints
+        if use_asr_hints:
+            speech_context = {
+                'phrases': context['asr_hints']
+            }
+        else:
+            speech_context = {}
+        self.asr_config = speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+            sample_rate_hertz=SAMPLE_RATE,
+            language_code=GOOGLE_LANGUAGE_CODE,
+            speech_contexts=[speech_context]
+        )
+
+    def settings(self):
+        return {
+            'sample_rate_hertz': SAMPLE_RATE,
+            'language_code': GOOGLE_LANGUAGE_CODE,
+            'asr_hints': self.context['asr_hints'] if self.use_asr_hints else [],  # noqa
+        }
+
+    def recognize(self, content, url):
+        sound = AudioSegment.from_wav(io.BytesIO(content))
+        sound = sound.set_channels(1)
+        buffer = io.BytesIO()
+        sound.export(buffer, format="wav")
+
+        audio = speech.RecognitionAudio(content=buffer.getvalue())
+        response = get_speech_client().recognize(
+            config=self.asr_config, audio=audio
+        )
+        google_transcript = ''
+        for result in response.results:
+            google_transcript = result.alternatives[0].transcript
+        return google_transcript
+
+
+@register_engine('indic_conformer')
+class IndicConformerEngine(ASREngine):
+    def __init__(self, name, context, url=None, timeout=60, **options):
+        super().__init__(name, context, **options)
+        self.url = url or f"http://{context['bhashini_ip']}:4992/recognize/en"
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=max(1, int(context['concurrency'].get(name, 1)))
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def settings(self):
+        return {
+            'url': self.url,
+            'sample_rate': SAMPLE_RATE,
+        }
+
+    def recognize(self, content, url):
+        # Load the wav bytes into the base64 format
+        encoded_string = str(base64.b64encode(content), 'ascii', 'ignore')
+
+        # POST request data format
+        data = {
+            "config": {
+                "language": {
+                    "sourceLanguage": "en"
+                },
+                "transcriptionFormat": {
+                    "value": "transcript"
+                },
+                "audioFormat": "wav",
+                "samplingRate": str(SAMPLE_RATE),
+                "postProcessors": None
+            },
+            "audio": [
+                {
+                    "audioContent": encoded_string
+                }
+            ]
+        }
+
+        # Send the API request
+        x = self.session.post(
+            self.url, data=json.dumps(data), timeout=self.timeout
+        )
+        return json.loads(x.text)["output"][0]["source"]
+
+
+@register_engine('bhashini')
+class BhashiniEngine(ASREngine):
+    """IndicWav2Vec through transcribe.sh, which needs the clip URL"""
+
+    def __init__(self, name, context, script='transcribe.sh', **options):
+        super().__init__(name, context, **options)
+        self.script = script
+
+    def settings(self):
+        return {'script': self.script}
+
+    def recognize(self, content, url):
+        command = "bash {script} {audio}".format(script=self.script, audio=url)
+        output = None
+        with Popen(command, stdout=PIPE, stderr=None, shell=True) as process:
+            output = process.communicate()[0].decode("utf-8")
+        try:
+            return ast.literal_eval(output)['output'][0]['source']
+        except: # noqa
+            return ""
+
+
+def build_engines(specs, context):
+    """Create one adapter per entry of the 'engines' config.
+
+    An entry is either the name of a builtin engine or a dict with a
+    `name`, a registered `type` and optional `options`.
+    Returns an ordered dict of name -> adapter.
+    """
+    engines = {}
+    for spec in specs:
+        if isinstance(spec, str):
+            if spec not in BUILTIN_ENGINES:
+                raise ValueError(f"Unknown engine '{spec}'")
+            name = spec
+            engine_type, options = BUILTIN_ENGINES[spec]
+        else:
+            name = spec['name']
+            engine_type = spec.get('type', name)
+            options = spec.get('options', {})
+        if engine_type not in ENGINE_TYPES:
+            raise ValueError(f"Unknown engine type '{engine_type}'")
+        engines[name] = ENGINE_TYPES[engine_type](name, context, **options)
+    return engines
@@ -0,0 +1,69 @@
+import os
+import sqlite3
+import hashlib
+import tempfile
+import threading
+
+
+class AudioStore(object):
+    """Content-addressed store of downloaded audio clips.
+
+    Each clip is written once as `<directory>/<sha256>.wav` and an SQLite
+    index maps the source URL to that digest, so every engine reads the
+    same local copy and later runs never download a clip again. Without a
+    directory the store lives in a temporary directory for the run.
+    """
+
+    def __init__(self, directory=None):
+        if directory is None:
+            self.tempdir = tempfile.TemporaryDirectory(prefix='audio_store_')
+            directory = self.tempdir.name
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(
+            os.path.join(directory, 'index.sqlite'),
+            check_same_thread=False
+        )
+        with self.lock:
+            self.conn.execute(
+                'CREATE TABLE IF NOT EXISTS clips ('
+                'url TEXT PRIMARY KEY, digest TEXT NOT NULL)'
+            )
+            self.conn.commit()
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest + '.wav')
+
+    def lookup(self, url):
+        """Digest of the clip stored for url, or None"""
+        with self.lock:
+            row = self.conn.execute(
+                'SELECT digest FROM clips WHERE url = ?', (url,)
+            ).fetchone()
+        if row is None or not os.path.exists(self.path(row[0])):
+            return None
+        return row[0]
+
+    def put(self, url, content):
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        with self.lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO clips VALUES (?, ?)', (url, digest)
+            )
+            self.conn.commit()
+        return digest
+
+    def read(self, digest):
+        with open(self.path(digest), 'rb') as f:
+            return f.read()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,94 @@
+import json
+import argparse
+from timeit import timeit
+
+from utils import response_pb2dict, response_pb2dict_json
+from capture_store import CaptureStore
+from slang_types_pb2 import SlangResponsePB
+
+
+def fill_entity(entity_pb, key, value):
+    entity_pb.key = key
+    if isinstance(value, list):
+        entity_pb.is_list = True
+        for item in value:
+            fill_entity(entity_pb.list_values.add(), key, item)
+    elif isinstance(value, dict):
+        entity_pb.is_composite = True
+        for k, v in value.items():
+            if v is not None:
+                fill_entity(entity_pb.composite_values[k], k, v)
+    else:
+        entity_pb.str_val = str(value)
+
+
+def sample_responses(reference_file):
+    """Serialized responses built from the labels of the reference dump"""
+    with open(reference_file) as f:
+        references = json.load(f)
+    out = []
+    for reference in references:
+        response = SlangResponsePB()
+        intent_response = response.intent_response
+        intent_response.intent_string = reference['labeled_intent']
+        for key, value in reference['labeled_entities'].items():
+            fill_entity(intent_response.entities.add(), key, value)
+        out.append(response.SerializeToString())
+    return out
+
+
+def captured_responses(capture_file):
+    """text2intent responses recorded in a capture archive"""
+    with CaptureStore(capture_file, mode='replay') as store:
+        return store.responses('nlu')
+
+
+def main(references, capture, repeat):
+    if capture:
+        responses = captured_responses(capture)
+    else:
+        responses = sample_responses(references)
+    print(f"{len(responses)} responses, {sum(map(len, responses))} bytes")
+    if not responses:
+        return
+
+    for content in responses:
+        expected = response_pb2dict_json(content)
+        if response_pb2dict(content) != expected:
+            raise AssertionError(f"Decoders disagree on {content!r}")
+    print("Both decoders produce the same output")
+
+    for decoder in (response_pb2dict_json, response_pb2dict):
+        seconds = timeit(
+            lambda: [decoder(content) for content in responses],
+            number=repeat
+        )
+        per_response = seconds / (repeat * len(responses)) * 1e6
+        print(f"{decoder.__name__:24s} {per_response:8.2f} us / response")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--references',
+        default='payments.final.snlf.fixed.json',
+        help='reference dump to build sample responses from',
+    )
+    parser.add_argument(
+        '--capture',
+        default=None,
+        help='capture archive whose text2intent responses to decode instead',
+    )
+    parser.add_argument('--repeat', type=int, default=20)
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(
+        args.references,
+        args.capture,
+        args.repeat
+    )
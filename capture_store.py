@@ -0,0 +1,107 @@
+import json
+import hashlib
+from urllib.parse import urlsplit
+
+from asr_cache import SQLiteStore
+from slang_types_pb2 import SlangRequestPB
+
+CAPTURE_MODES = ('off', 'record', 'replay')
+
+
+class CaptureStore(SQLiteStore):
+    """Archive of recorded NLU and ASR exchanges backed by SQLite.
+
+    Each row holds the raw request and response bytes of one exchange,
+    indexed by its kind ('nlu' or 'asr') and a key that is stable across
+    runs. text2intent requests carry random request and session ids, so
+    they are keyed by the URL path and query, the utterance text and the
+    app_id. ASR results are captured at the engine adapter and keyed by
+    the engine, its settings and the sha256 of the audio.
+
+    In 'record' mode the live traffic is written as it happens; in
+    'replay' mode it is served back instead, by replay_server.py for
+    text2intent and by the adapters for ASR.
+    """
+
+    schema = (
+        'CREATE TABLE IF NOT EXISTS exchanges ('
+        'kind TEXT NOT NULL, '
+        'key TEXT NOT NULL, '
+        'request BLOB, '
+        'status INTEGER NOT NULL, '
+        'content_type TEXT, '
+        'response BLOB NOT NULL, '
+        'PRIMARY KEY (kind, key))'
+    )
+
+    def __init__(self, path='capture.sqlite', mode='record'):
+        if mode not in CAPTURE_MODES:
+            raise ValueError(f"Unknown capture mode '{mode}'")
+        super().__init__(path)
+        self.mode = mode
+
+    @property
+    def recording(self):
+        return self.mode == 'record'
+
+    @property
+    def replaying(self):
+        return self.mode == 'replay'
+
+    @staticmethod
+    def nlu_key(url, body):
+        """Key of a text2intent request, whatever its request/session ids"""
+        parts = urlsplit(url)
+        request = SlangRequestPB()
+        request.ParseFromString(body)
+        identity = [
+            parts.path + '?' + parts.query,
+            request.text_request.header.app_id,
+            request.text_request.text,
+        ]
+        encoded = json.dumps(identity).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    @staticmethod
+    def asr_key(engine, settings, content):
+        identity = [
+            engine,
+            settings,
+            hashlib.sha256(content).hexdigest(),
+        ]
+        encoded = json.dumps(identity, sort_keys=True).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def get(self, kind, key):
+        """(status, content_type, response) of a recorded exchange, or None"""
+        row = self.fetchone(
+            'SELECT status, content_type, response FROM exchanges '
+            'WHERE kind = ? AND key = ?',
+            (kind, key)
+        )
+        if row is None:
+            return None
+        return row[0], row[1], bytes(row[2])
+
+    def put(self, kind, key, request, status, content_type, response):
+        self.write(
+            'INSERT OR REPLACE INTO exchanges VALUES (?, ?, ?, ?, ?, ?)',
+            (kind, key, request, status, content_type, response)
+        )
+
+    def responses(self, kind):
+        """Response bytes of every recorded exchange of kind with a 200"""
+        rows = self.fetchall(
+            'SELECT response FROM exchanges WHERE kind = ? AND status = 200',
+            (kind,)
+        )
+        return [bytes(row[0]) for row in rows]
+
+    def count(self, kind=None):
+        if kind is None:
+            row = self.fetchone('SELECT COUNT(*) FROM exchanges')
+        else:
+            row = self.fetchone(
+                'SELECT COUNT(*) FROM exchanges WHERE kind = ?', (kind,)
+            )
+        return row[0]
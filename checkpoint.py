@@ -0,0 +1,75 @@
+import os
+import json
+import threading
+from collections import defaultdict
+
+
+class Checkpoint(object):
+    """Append-only log of finished per-utterance work.
+
+    Every row is a JSON line `{"engine", "stage", "idx", "file_name",
+    "payload"}` that is flushed and fsync'ed as soon as it is recorded, so
+    a crashed run loses at most the utterances that were in flight.
+    Opening with `resume=True` loads the existing rows and keeps appending,
+    otherwise the file is truncated.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.rows = defaultdict(dict)
+        if resume and os.path.exists(path):
+            self.load()
+        self.file = open(path, 'a' if resume else 'w')
+
+    def load(self):
+        end = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    # A partially written last line from a crashed run
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                end += len(line)
+                key = (row['engine'], row['stage'])
+                self.rows[key][row['idx']] = row
+        # Drop the torn tail so that new rows start on a line of their own
+        with open(self.path, 'r+b') as f:
+            f.truncate(end)
+
+    def done(self, engine, stage, file_names):
+        """Payloads recorded for (engine, stage) as a dict of idx -> payload.
+
+        Rows whose file name no longer matches the dataset are ignored.
+        """
+        out = {}
+        for idx, row in self.rows[(engine, stage)].items():
+            if idx < len(file_names) and file_names[idx] == row['file_name']:
+                out[idx] = row['payload']
+        return out
+
+    def record(self, engine, stage, idx, file_name, payload):
+        row = {
+            'engine': engine,
+            'stage': stage,
+            'idx': idx,
+            'file_name': file_name,
+            'payload': payload,
+        }
+        line = json.dumps(row) + '\n'
+        with self.lock:
+            self.rows[(engine, stage)][idx] = row
+            self.file.write(line)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+    def remove(self):
+        self.close()
+        os.remove(self.path)
@@ -0,0 +1,88 @@
+from array import array
+
+import numpy as np
+from rapidfuzz.distance import Levenshtein
+
+
+class CorpusStats(object):
+    """Streaming corpus-level error counts for one engine and cohort.
+
+    `update` adds the word error breakdown of one utterance. Only the
+    running totals and two small per-utterance counts (errors and
+    reference length, for word and character level) are kept, which is
+    all the bootstrap needs; alignments are never stored.
+    """
+
+    def __init__(self):
+        self.substitutions = 0
+        self.deletions = 0
+        self.insertions = 0
+        self.sentence_errors = 0
+        self.word_errors = array('l')
+        self.word_lengths = array('l')
+        self.char_errors = array('l')
+        self.char_lengths = array('l')
+
+    def update(self, substitutions, deletions, insertions, reference_length,
+               char_errors, reference_chars):
+        self.substitutions += substitutions
+        self.deletions += deletions
+        self.insertions += insertions
+        errors = substitutions + deletions + insertions
+        if errors > 0:
+            self.sentence_errors += 1
+        self.word_errors.append(errors)
+        self.word_lengths.append(reference_length)
+        self.char_errors.append(char_errors)
+        self.char_lengths.append(reference_chars)
+
+    @staticmethod
+    def char_counts(hypothesis, reference):
+        """Character edit distance and length of the reference"""
+        hypothesis = ' '.join(hypothesis.split())
+        reference = ' '.join(reference.split())
+        return Levenshtein.distance(reference, hypothesis), len(reference)
+
+    @staticmethod
+    def bootstrap(errors, lengths, n_resamples, confidence, seed):
+        """Percentile interval of sum(errors) / sum(lengths) over utterances"""
+        n = len(errors)
+        if n == 0:
+            return [0.0, 0.0]
+        rng = np.random.default_rng(seed)
+        errors = np.asarray(errors)
+        lengths = np.asarray(lengths)
+        rates = np.empty(n_resamples)
+        for b in range(n_resamples):
+            idx = rng.integers(0, n, n)
+            rates[b] = errors[idx].sum() / max(lengths[idx].sum(), 1)
+        alpha = (1 - confidence) / 2
+        low, high = np.quantile(rates, [alpha, 1 - alpha])
+        return [float(low), float(high)]
+
+    def summary(self, n_resamples=1000, confidence=0.95, seed=0):
+        words = sum(self.word_lengths)
+        chars = sum(self.char_lengths)
+        sentences = len(self.word_lengths)
+        errors = self.substitutions + self.deletions + self.insertions
+        return {
+            'wer': errors / words if words else 0.0,
+            'cer': sum(self.char_errors) / chars if chars else 0.0,
+            'ser': self.sentence_errors / sentences if sentences else 0.0,
+            'substitutions': self.substitutions,
+            'deletions': self.deletions,
+            'insertions': self.insertions,
+            'reference_words': words,
+            'reference_chars': chars,
+            'sentences': sentences,
+            'sentence_errors': self.sentence_errors,
+            'confidence': confidence,
+            'wer_ci': self.bootstrap(
+                self.word_errors, self.word_lengths,
+                n_resamples, confidence, seed
+            ),
+            'cer_ci': self.bootstrap(
+                self.char_errors, self.char_lengths,
+                n_resamples, confidence, seed
+            ),
+        }
@@ -0,0 +1,180 @@
+import sqlite3
+import argparse
+from array import array
+from collections import Counter, defaultdict
+
+import numpy as np
+
+OPS = ['S', 'D', 'I']
+
+
+class AlignmentLog(object):
+    """Columnar log of the word errors of one engine and cohort.
+
+    Every error is a row of four int columns: the utterance index, the op
+    (0 = substitution, 1 = deletion, 2 = insertion) and the reference and
+    hypothesis word ids (-1 for the missing side). Words are interned in
+    the log's own vocabulary.
+    """
+
+    def __init__(self):
+        self.vocabulary = {}
+        self.words = []
+        self.clip = array('q')
+        self.op = array('b')
+        self.ref = array('q')
+        self.hyp = array('q')
+
+    def word_id(self, word):
+        if word is None:
+            return -1
+        idx = self.vocabulary.get(word)
+        if idx is None:
+            idx = self.vocabulary[word] = len(self.words)
+            self.words.append(word)
+        return idx
+
+    def add(self, clip, errors):
+        for op, ref_word, hyp_word in errors:
+            self.clip.append(clip)
+            self.op.append(OPS.index(op))
+            self.ref.append(self.word_id(ref_word))
+            self.hyp.append(self.word_id(hyp_word))
+
+    def save(self, path, clip_ids):
+        np.savez_compressed(
+            path,
+            clip=np.frombuffer(self.clip, dtype=np.int64),
+            op=np.frombuffer(self.op, dtype=np.int8),
+            ref=np.frombuffer(self.ref, dtype=np.int64),
+            hyp=np.frombuffer(self.hyp, dtype=np.int64),
+            words=np.array(self.words, dtype=str),
+            clip_ids=np.array(clip_ids, dtype=str),
+        )
+
+    def confusions(self):
+        """Counter of (op, ref_word, hyp_word) and their utterance indices"""
+        counts = Counter()
+        clips = defaultdict(set)
+        for clip, op, ref, hyp in zip(self.clip, self.op, self.ref, self.hyp):
+            key = (
+                OPS[op],
+                self.words[ref] if ref >= 0 else '',
+                self.words[hyp] if hyp >= 0 else '',
+            )
+            counts[key] += 1
+            clips[key].add(clip)
+        return counts, clips
+
+
+class ErrorIndex(object):
+    """SQLite index of confusion pairs across engines and cohorts.
+
+    `confusions` holds one row per (cohort, engine, op, ref, hyp) with its
+    count, `confusion_clips` the clip ids it was seen in. Deleted and
+    inserted words have an empty hyp and ref respectively.
+    """
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(
+            'CREATE TABLE IF NOT EXISTS confusions ('
+            'cohort TEXT, engine TEXT, op TEXT, ref TEXT, hyp TEXT, '
+            'count INTEGER, '
+            'PRIMARY KEY (cohort, engine, op, ref, hyp));'
+            'CREATE TABLE IF NOT EXISTS confusion_clips ('
+            'cohort TEXT, engine TEXT, op TEXT, ref TEXT, hyp TEXT, '
+            'clip_id TEXT);'
+            'CREATE INDEX IF NOT EXISTS confusions_count '
+            'ON confusions (count DESC);'
+            'CREATE INDEX IF NOT EXISTS confusion_clips_pair '
+            'ON confusion_clips (ref, hyp);'
+        )
+        self.conn.commit()
+
+    def add(self, cohort, engine, log, clip_ids):
+        """Replace the confusions of (cohort, engine) with those in log"""
+        counts, clips = log.confusions()
+        for table in ('confusions', 'confusion_clips'):
+            self.conn.execute(
+                f'DELETE FROM {table} WHERE cohort = ? AND engine = ?',
+                (cohort, engine)
+            )
+        self.conn.executemany(
+            'INSERT INTO confusions VALUES (?, ?, ?, ?, ?, ?)',
+            [(cohort, engine, *key, count) for key, count in counts.items()]
+        )
+        self.conn.executemany(
+            'INSERT INTO confusion_clips VALUES (?, ?, ?, ?, ?, ?)',
+            [
+                (cohort, engine, *key, clip_ids[clip])
+                for key, idx in clips.items()
+                for clip in sorted(idx)
+            ]
+        )
+        self.conn.commit()
+
+    def top(self, n=20, cohort=None, engine=None, op=None):
+        """Most frequent confusions summed over the matching engines/cohorts"""
+        where = []
+        params = []
+        for column, value in (('cohort', cohort), ('engine', engine), ('op', op)):   # noqa
+            if value is not None:
+                where.append(f'{column} = ?')
+                params.append(value)
+        clause = ('WHERE ' + ' AND '.join(where)) if where else ''
+        rows = self.conn.execute(
+            f'SELECT op, ref, hyp, SUM(count) AS total FROM confusions '
+            f'{clause} GROUP BY op, ref, hyp ORDER BY total DESC LIMIT ?',
+            params + [n]
+        ).fetchall()
+        out = []
+        for op_, ref, hyp, total in rows:
+            clip_ids = [
+                row[0] for row in self.conn.execute(
+                    f'SELECT DISTINCT clip_id FROM confusion_clips '
+                    f'{clause} {"AND" if where else "WHERE"} '
+                    f'op = ? AND ref = ? AND hyp = ?',
+                    params + [op_, ref, hyp]
+                )
+            ]
+            out.append({
+                'op': op_,
+                'ref': ref,
+                'hyp': hyp,
+                'count': total,
+                'clip_ids': clip_ids,
+            })
+        return out
+
+
+def main(index, top, cohort, engine, op):
+    for row in ErrorIndex(index).top(top, cohort, engine, op):
+        print(f"{row['count']:6d}  {row['op']}  {row['ref'] or '-'} -> {row['hyp'] or '-'}  ({len(row['clip_ids'])} clips)")   # noqa
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--index',
+        default='error_index.sqlite',
+        help='error index written by evaluate_asr.py',
+    )
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--cohort', default=None)
+    parser.add_argument('--engine', default=None)
+    parser.add_argument('--op', choices=OPS, default=None)
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(
+        args.index,
+        args.top,
+        args.cohort,
+        args.engine,
+        args.op
+    )
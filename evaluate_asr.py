@@ -1,35 +1,39 @@
 import os
-import io
-import re
-import ast
 import json
-import jiwer
 import argparse
 import requests
 import pandas as pd
 from tqdm import tqdm
-from copy import deepcopy
-from tqdm.contrib import tzip
 from slang_metrics import SlangMetrics
-from metrics import evaluate_intents, evaluate_entities
-import base64
+from metrics import evaluate_intent_runs, evaluate_entities, TRACKED_ENTITIES
+from concurrent.futures import ThreadPoolExecutor
 from utils import Config
-from google.cloud import speech
-import urllib.request
-from subprocess import PIPE, Popen
-from slanglabs_nlu.entity_extraction.parsers import parse_numbers
-from pydub import AudioSegment
+from asr_cache import HypothesisCache
+from checkpoint import Checkpoint
+from audio_store import AudioStore
+from url_manifest import UrlManifest
+from asr_engines import build_engines
+from wer import WEREngine
+from corpus_metrics import CorpusStats
+from error_index import AlignmentLog, ErrorIndex
+from text_normalizer import TextNormalizer
 
 
-hypothesis_cache = {}
-dropped_idx = []
-urls_checked = False
-
 class Driver(object):
-    def __init__(self, config, cohort): 
-        global urls_checked, dropped_idx
+    """ASR and NLU evaluation of one dataset.
+
+    `config` holds everything about the dataset and the engines. Audio is
+    fetched and transcribed once; the hypotheses are then normalized,
+    scored and sent to NLU once per cohort. `cohort` names the
+    normalization settings of `config` itself, and `cohorts` maps the
+    names of further cohorts to the Config whose normalization settings
+    and results_dump they use.
+    """
+
+    def __init__(self, config, cohort, resume=False, cohorts=None):
         self.config = config
         self.cohort = cohort
+        self.resume = resume
         file_name = self.config.config['data']
         with open(file_name) as f:
             self.data = json.load(f)
@@ -40,62 +44,79 @@ class Driver(object):
         self.metrics = SlangMetrics()
         self.directory = self.config.config['directory']
         self.bhashini_ip = self.config.config['bhashini_ip']
-        self.use_slang_normalizer = self.config.config['use_slang_normalizer']
-        self.use_nemo = self.config.config['use_nemo']
-        self.use_number_parser = self.config.config['use_number_parser']
         self.use_url = self.config.config['use_url']
         asr_hints_file = self.config.config['asr_hints_file']
         self.asr_hints = self.read_asr_hints(asr_hints_file)
         self.base_url = self.config.config['base_url']
         self.dropped_idx = []
         self.df = pd.DataFrame([])
-        if self.use_nemo:
-            from nemo_text_processing.inverse_text_normalization.inverse_normalize import InverseNormalizer
-            self.inverse_normalizer  = InverseNormalizer(lang='en') 
+        self.wer_engine = WEREngine()
+        error_index = self.config.config.get('error_index')
+        self.error_index = ErrorIndex(error_index) if error_index else None
+        self.cohorts = {cohort: config}
+        self.cohorts.update(cohorts or {})
+        self.normalizers = {
+            name: TextNormalizer.from_config(cohort_config.config)
+            for name, cohort_config in self.cohorts.items()
+        }
+        self.dfs = {}
+        self.combined_dump_file = self.config.config.get('combined_results_dump')   # noqa
         if self.use_url is False:
             self.files = os.listdir(self.directory)
-        else:
-            pass
-            if urls_checked == False:
-                print("Checking and dropping wrong URLs")
-                dropped_idx = self.check_url_exists()
-                urls_checked = True
-            #self.df = self.df.drop(dropped_idx)
-            print(dropped_idx)
-            print(f"Dropped {len(dropped_idx)} URLs. {len(self.df)} URLs left") # noqa
-        self.asr_engines = self.config.config['engines']
-
-    def check_url_exists(self):
-        indices = []
-        for idx, f in enumerate(tqdm(self.data)):
-            f = self.data[idx]['file_name']
-            url = self.base_url + f.replace(" ", "-") + '.wav'
-            status_code = requests.get(url).status_code
-            if status_code != 200:
-                indices.append(idx)
-        return indices
+        self.concurrency = self.config.config.get('concurrency', {})
+        self.engines = build_engines(self.config.config['engines'], {
+            'asr_hints': self.asr_hints,
+            'bhashini_ip': self.bhashini_ip,
+            'concurrency': self.concurrency,
+            'capture': self.config.capture,
+        })
+        self.asr_engines = list(self.engines)
+        self.settings_hashes = {
+            name: HypothesisCache.hash_settings(adapter.settings())
+            for name, adapter in self.engines.items()
+        }
+        cache_file = self.config.config.get('hypothesis_cache')
+        self.hypothesis_cache = HypothesisCache(cache_file or ':memory:')
+        self.audio_store = AudioStore(self.config.config.get('audio_store'))
+        self.download_concurrency = self.config.config.get('download_concurrency', 8)   # noqa
+        self.download_timeout = self.config.config.get('download_timeout', 30)   # noqa
+        self.url_manifest = UrlManifest(self.config.config.get('url_manifest'))
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=max(1, int(self.download_concurrency))
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def clip_url(self, file_name):
+        if self.use_url:
+            return self.base_url + file_name.replace(" ", "-") + '.wav'
+        return os.path.join(self.directory, file_name + '.wav')
+
+    def fetch_clip(self, url):
+        """Store the clip at url once and return its digest, None if missing"""
+        try:
+            digest = self.audio_store.lookup(url)
+            if digest is None:
+                digest = self.audio_store.put(url, self.fetch_audio(url))
+            return digest
+        except Exception as e:
+            print('Could not fetch', url, e)
+            return None
+
+    def fetch_clips(self, urls):
+        workers = max(1, int(self.download_concurrency))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(self.fetch_clip, urls)
+            return list(tqdm(results, total=len(urls)))
 
     def read_asr_hints(self, hints_file):
         with open(hints_file) as f:
             hints = json.load(f)
         return hints
 
-    def normalize_str(self, string):
-        string = re.sub(r'[!"#$*,\/;<=>?[\]^_`{|}~.]+', '', string)  # noqa  Remove special characters
-        string = re.sub(r'[()]', ' ', string)
-        return string.strip().lower()
-
-    
     def filter_entities(self, responses, pred_response=False):
-        _filter = [
-            'payments_bill_type',
-            'payments_bill_action',
-            'payments_navigation_target',
-            'payments_transaction_action',
-            'payments_name',
-            'payments_transaction_amount'
-        ]
-
+        _filter = TRACKED_ENTITIES
         _responses = responses
         for i, item in enumerate(_responses):
             ent = []
@@ -118,236 +139,310 @@ class Driver(object):
             _responses[i] = item
         return _responses
 
-    def transform_text(self, text):
-        out = text
-        if self.use_slang_normalizer:
-            out = self.normalize_str(out)
-
-        if self.use_nemo:
-            out = self.inverse_normalizer.inverse_normalize(out, verbose=False)
+    def transform_text(self, text, cohort=None):
+        return self.normalizers[cohort or self.cohort](text)
 
-        if self.use_number_parser:
-            out = self.apply_number_parser(out)
+    def transform_references(self, cohort=None):
+        """Transformed references of every clip, None where it failed"""
+        self.normalizers[cohort or self.cohort].transform_batch(
+            [ref for f in self.data for ref in f['references']]
+        )
+        out = []
+        for f in self.data:
+            try:
+                out.append([self.transform_text(ref, cohort) for ref in f['references']])   # noqa
+            except Exception as e:
+                print('Exception caught', e)
+                out.append(None)
+        return out
 
+    def fetch_audio(self, url):
+        """Return the wav bytes at url, or at the local path url"""
+        if not self.use_url:
+            with open(url, 'rb') as f:
+                return f.read()
+        response = self.session.get(url, timeout=self.download_timeout)
+        response.raise_for_status()
+        return response.content
+
+    def transcript_audio(self, digest, url, engine):
+        adapter = self.engines[engine]
+        settings_hash = self.settings_hashes[engine]
+        out = self.hypothesis_cache.get(digest, engine, settings_hash)
+        if out is None:
+            content = self.audio_store.read(digest)
+            out = adapter.transcribe(content, url)
+            self.hypothesis_cache.put(digest, engine, settings_hash, out)
+        elif self.config.capture is not None and self.config.capture.recording:   # noqa
+            # Keep the capture complete for hypotheses served from cache
+            adapter.record(self.audio_store.read(digest), url, out)
         return out
-            
-
-    def apply_number_parser(self, text):
-        updated_text = deepcopy(text)
-        numbers = parse_numbers(text)
-        for number in numbers:
-            start_idx, end_idx = number[1]
-            substring = text[start_idx:end_idx+1]
-            updated_text = updated_text.replace(substring, str(number[0]))
-        return updated_text
-
-    def prepare_google_speech(self, use_asr_hints):
-        self.client = speech.SpeechClient()
-        
-        if use_asr_hints:
-            context = {
-                'phrases': self.asr_hints
-            }
-        else:
-            context = {}
-        self.asr_config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-            sample_rate_hertz=16000,
-            language_code="en-IN",
-            speech_contexts=[context]
-        )
 
-    def transcribe_google_speech(self, speech_url):
-        """Transcribe the given audio url"""
-        speech_file = "temp.wav"
-        if self.use_url:
-            urllib.request.urlretrieve(speech_url, speech_file)
-        else:
-            speech_file = speech_url
-
-        sound = AudioSegment.from_wav(speech_file)
-        sound = sound.set_channels(1)
-        sound.export(speech_file, format="wav")
-
-
-        with io.open(speech_file, "rb") as audio_file:
-            content = audio_file.read()
-        audio = speech.RecognitionAudio(content=content)
-        response = self.client.recognize(config=self.asr_config, audio=audio)
-        google_transcript = ''
-        for result in response.results:
-            google_transcript = result.alternatives[0].transcript
-        return google_transcript
-
-    def transcribe_bhashini(self, audio):
-        command = "bash transcribe.sh {audio}".format(audio=audio)
-        output = None
-        with Popen(command, stdout=PIPE, stderr=None, shell=True) as process:
-            output = process.communicate()[0].decode("utf-8")
+    def safe_transcript_audio(self, digest, url, engine):
         try:
-            return ast.literal_eval(output)['output'][0]['source']
-        except: # noqa
-            return ""
-
-    def transcribe_indic_conformer(self, speech_url):
-        # API URL
-        API_URL = f'http://{self.bhashini_ip}:4992/recognize/en'
-
-        speech_file = "temp.wav"
-
-        urllib.request.urlretrieve(speech_url, speech_file)
-
-        # Load the wav file into the base64 format
-        with open("temp.wav", "rb") as wav_file:
-            encoded_string = base64.b64encode(wav_file.read())
-        # Encode the file.
-        encoded_string = str(encoded_string, 'ascii', 'ignore')
-
-        # POST request data format
-        data = {
-            "config": {
-                "language": {
-                    "sourceLanguage": "en"
-                },
-                "transcriptionFormat": {
-                    "value": "transcript"
-                },
-                "audioFormat": "wav",
-                "samplingRate": "16000",
-                "postProcessors": None
-            },
-            "audio": [
-                {
-                    "audioContent": encoded_string
-                }
-            ]
-        }
+            return self.transcript_audio(digest, url, engine)
+        except Exception as e:
+            print('Exception caught', e)
+            return None
+
+    def transcribe_files(self, digests, urls, engine, on_result=None):
+        """Transcribe stored clips concurrently, keeping them in dataset order.
+
+        At most `concurrency[engine]` requests are in flight at a time.
+        Failed transcriptions are returned as None. `on_result(i, hypothesis)`
+        is called from the worker as soon as digests[i] is done.
+        """
+        def work(i):
+            hypothesis = self.safe_transcript_audio(digests[i], urls[i], engine)   # noqa
+            if on_result is not None:
+                on_result(i, hypothesis)
+            return hypothesis
+
+        workers = max(1, int(self.concurrency.get(engine, 1)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(work, range(len(digests)))
+            return list(tqdm(results, total=len(digests)))
 
-        # Send the API request
-        x = requests.post(API_URL, data=json.dumps(data))
-        return json.loads(x.text)["output"][0]["source"]
-
-    def transcript_audio(self, url, engine):
-        if engine == 'google_speech':
-            self.prepare_google_speech(False)
-            out = self.transcribe_google_speech(url)
-        elif engine == 'slang_google_speech':
-            self.prepare_google_speech(True)
-            out = self.transcribe_google_speech(url)
-        elif engine == 'indic_conformer':
-            out = self.transcribe_indic_conformer(url)
-        '''
-        elif engine == 'nemo_indic_conformer':
-            out = self.transcribe_indic_conformer(url)
-            out = inverse_normalizer.inverse_normalize(out, verbose=False)
-        elif engine == 'slang_indic_conformer':
-            out = self.transcribe_indic_conformer(url)
-            out = inverse_normalizer.inverse_normalize(out, verbose=False)
-            out = self.apply_number_parser(out)
-        elif engine == 'nemo_google_speech':
-            self.prepare_google_speech(True)
-            out = self.transcribe_google_speech(url)
-            out = inverse_normalizer.inverse_normalize(out, verbose=False)
-        elif engine == 'indic_wav2vec':
-            out = self.transcribe_bhashini(url)
-        elif engine == 'slang_indic_wav2vec':
-            out = self.transcribe_bhashini(url)
-            out = self.normalize_str(out)
-            out = self.apply_number_parser(out)
-        '''
-        return out
-    
     def get_best_wer(self, asr_transcript, references):
-        wers = []
-        for ref in references:
-            wers.append(jiwer.wer(ref, asr_transcript))
-        return min(wers)
-
-    def run(self):
-        with open(self.dump_file) as f:
-            reference_responses = json.load(f)
-        reference_responses = [res for i, res in enumerate(reference_responses) if i not in dropped_idx]   # noqa
-        self.data = [res for i, res in enumerate(self.data) if i not in dropped_idx]
-        all_references = []
+        return self.wer_engine.score(asr_transcript, references).wer
+
+    def transcribe_engine(self, engine, digests, urls, file_names, checkpoint):   # noqa
+        """Raw hypotheses of engine for every clip, None where it failed"""
+        print(f"Transcribing with {engine}")
+        transcribed = checkpoint.done(engine, 'asr', file_names)
+        hypotheses = [transcribed.get(i, {}).get('raw') for i in range(len(digests))]   # noqa
+        pending = [i for i, h in enumerate(hypotheses) if h is None]
+        if len(pending) < len(digests):
+            print(f"Resuming: {len(digests) - len(pending)} transcriptions already done")   # noqa
+
+        def record_hypothesis(j, hypothesis):
+            if hypothesis is not None:
+                i = pending[j]
+                checkpoint.record(engine, 'asr', i, file_names[i], {'raw': hypothesis})   # noqa
+
+        results = self.transcribe_files(
+            [digests[i] for i in pending],
+            [urls[i] for i in pending],
+            engine,
+            on_result=record_hypothesis
+        )
+        print(f"{engine}: {self.engines[engine].stats()}")
+        for i, hypothesis in zip(pending, results):
+            hypotheses[i] = hypothesis
+        return hypotheses
+
+    def score_cohort(self, cohort, hypotheses, reference_responses,
+                     file_names, checkpoint):
+        """Normalize, score and run NLU on the hypotheses for one cohort.
+
+        Returns the cohort's results table, one row per clip.
+        """
+        df = pd.DataFrame([])
+        normalizer = self.normalizers[cohort]
+        all_references = self.transform_references(cohort)
+        df['References'] = [",".join(i['references']) for i in self.data]
+        df["transformed_references"] = [
+            ",".join(references) if references is not None else ''
+            for references in all_references
+        ]
+        intent_runs = {}
         for engine in self.asr_engines:
-            print(f"Computing WER for {engine}")
+            print(f"Computing WER for {engine}, cohort {cohort}")
             predicted = []
             wers = []
-            score_list = []
-            urls = []
             raw_trascriptions = []
-            for i, f in enumerate(tqdm(self.data)):
-                references = f['references']
-                f = f['file_name']
-                if self.use_url:
-                    filepath = self.base_url + f.replace(" ", "-") + '.wav'
-                else:
-                    filepath = os.path.join(self.directory, f + '.wav')
-                urls.append(filepath)
+
+            corpus_stats = CorpusStats()
+            alignments = AlignmentLog()
+            scored = checkpoint.done(engine, f'score_{cohort}', file_names)
+            normalizer.transform_batch([
+                hypothesis or ''
+                for i, hypothesis in enumerate(hypotheses[engine])
+                if i not in scored
+            ])
+            for i, (hypothesis, references) in enumerate(zip(hypotheses[engine], all_references)):   # noqa
+                raw_trascriptions.append(hypothesis or '')
+                if i in scored:
+                    predicted.append(scored[i]['transcription'])
+                    wers.append(scored[i]['wer'])
+                    corpus_stats.update(*scored[i]['counts'])
+                    alignments.add(i, scored[i]['errors'])
+                    continue
                 try:
-                    check_hypothesis_cache = hypothesis_cache.get(engine)
-                    if check_hypothesis_cache is None:
-                        hypothesis_cache.update({engine:[]})
-
-                    if len(hypothesis_cache.get(engine)) == len(reference_responses):
-                        hypothesis = hypothesis_cache[engine][i]
-                    else:
-                        hypothesis = self.transcript_audio(filepath, engine)
-                        hypothesis_cache[engine].append(hypothesis)
-
-                    raw_trascriptions.append(hypothesis)
-                    hypothesis = self.transform_text(hypothesis)
-                    references = [self.transform_text(reference) for reference in references]
-                    # wer = jiwer.wer(reference, hypothesis)
-                    wer = self.get_best_wer(hypothesis, references)
-                    all_references.append(",".join(references))
-                    predicted.append(hypothesis)
-                    wers.append(wer)
+                    if references is None:
+                        raise ValueError("references could not be transformed")   # noqa
+                    # A failed transcription is scored as an empty one
+                    transcription = self.transform_text(hypothesis or '', cohort)   # noqa
+                    result = self.wer_engine.score(transcription, references)
+                    counts = [
+                        result.substitutions,
+                        result.deletions,
+                        result.insertions,
+                        result.reference_length,
+                        *CorpusStats.char_counts(
+                            transcription,
+                            self.wer_engine.decode(result.reference)
+                        ),
+                    ]
+                    corpus_stats.update(*counts)
+                    errors = self.wer_engine.errors(
+                        result.reference, result.hypothesis
+                    )
+                    alignments.add(i, errors)
+                    predicted.append(transcription)
+                    wers.append(result.wer)
+                    if hypothesis is not None:
+                        checkpoint.record(engine, f'score_{cohort}', i, file_names[i], {   # noqa
+                            'transcription': transcription,
+                            'wer': result.wer,
+                            'counts': counts,
+                            'errors': errors,
+                        })
                 except Exception as e:
                     print('Exception caught', e)
                     predicted.append('')
                     wers.append(1.0)
-            self.df['References'] = [",".join(i['references']) for i in self.data]
-            if len(all_references) == len(self.data):
-                self.df["transformed_references"] = all_references
-            self.df[engine+'_transcription_raw'] = raw_trascriptions
-            self.df[engine + '_transcription'] = predicted
-            self.df[engine + '_wer'] = wers
+            corpus_metrics = corpus_stats.summary()
+            print(f"{engine}: corpus WER {corpus_metrics['wer']:.4f} {corpus_metrics['wer_ci']}, CER {corpus_metrics['cer']:.4f}, SER {corpus_metrics['ser']:.4f}")   # noqa
+            with open(f'corpus_metrics_{engine}_{cohort}.json', 'w') as json_file:   # noqa
+                json.dump(corpus_metrics, json_file)
+            alignments.save(f'alignments_{engine}_{cohort}.npz', file_names)   # noqa
+            if self.error_index is not None:
+                self.error_index.add(cohort, engine, alignments, file_names)   # noqa
+            df[engine+'_transcription_raw'] = raw_trascriptions
+            df[engine + '_transcription'] = predicted
+            df[engine + '_wer'] = wers
             if self.config.config['score_nlp']:
-                pred_responses, _ = self.config.send_and_time_request(self.df[engine + '_transcription'])   # noqa
+                answered = checkpoint.done(engine, f'nlu_{cohort}', file_names)   # noqa
+                # A response recorded for an earlier transcription (e.g. the
+                # '' of a failed clip that has since been transcribed) is stale,
+                # and a failed request is tried again
+                pending = [
+                    i for i in range(len(predicted))
+                    if i not in answered
+                    or answered[i]['response'].get('text') != predicted[i]
+                    or answered[i]['response'].get('failed', False)
+                ]
+
+                def record_response(j, response, response_time):
+                    i = pending[j]
+                    checkpoint.record(engine, f'nlu_{cohort}', i, file_names[i], {'response': response})   # noqa
+
+                if pending:
+                    self.config.send_and_time_request(
+                        [predicted[i] for i in pending],
+                        on_response=record_response
+                    )
+                    answered = checkpoint.done(engine, f'nlu_{cohort}', file_names)   # noqa
+                pred_responses = [answered[i]['response'] for i in range(len(predicted))]   # noqa
                 pred_responses = self.filter_entities(pred_responses, pred_response=True)
-                self.df[engine+'_pred_response'] = pred_responses
-                intent_metrics = evaluate_intents(reference_responses, pred_responses)
+                df[engine+'_pred_response'] = pred_responses
+                intent_runs[engine] = pred_responses
                 entity_metrics = evaluate_entities(reference_responses, pred_responses, False)
-                with open(f'intent_metrics_{engine}_{self.cohort}.json', 'w') as json_file:
-                    json.dump(intent_metrics, json_file)
-
-                with open(f'entity_metrics_{engine}_{self.cohort}.json', 'w') as json_file:
+                with open(f'entity_metrics_{engine}_{cohort}.json', 'w') as json_file:
                     json.dump(entity_metrics, json_file)
-                '''
-                for i, (expected, predicted) in enumerate(tzip(reference_responses, pred_responses)):         # noqa
-                    asr_score = self.metrics.compute_asr_score(expected, predicted)
-                    score_list.append(asr_score)
-                self.df[engine+'_slang_score'] = score_list
-                '''
+        intent_metrics = evaluate_intent_runs(
+            reference_responses, intent_runs, self.config.get_all_intents()
+        )
+        for engine, metrics in intent_metrics.items():
+            with open(f'intent_metrics_{engine}_{cohort}.json', 'w') as json_file:   # noqa
+                json.dump(metrics, json_file)
+        slang_scores = self.metrics.score_columns(
+            reference_responses, intent_runs, TRACKED_ENTITIES
+        )
+        for engine, scores in slang_scores.items():
+            df[engine + '_slang_score'] = scores
+        return df
 
-        # self.df['reference_response'] = reference_responses
-        self.df['audio_links'] = urls
-        self.df.to_csv(self.results_dump_file, index=False)
+    def combined_results(self, cohort, df, file_names):
+        """The cohort's results table with one row per (clip, engine)"""
+        frames = []
+        for engine in self.asr_engines:
+            frame = pd.DataFrame({
+                'file_name': file_names,
+                'cohort': cohort,
+                'engine': engine,
+                'references': df['References'],
+                'transformed_references': df['transformed_references'],
+                'transcription_raw': df[engine + '_transcription_raw'],
+                'transcription': df[engine + '_transcription'],
+                'wer': df[engine + '_wer'],
+                'audio_links': df['audio_links'],
+            })
+            if engine + '_pred_response' in df:
+                frame['pred_response'] = df[engine + '_pred_response']
+            frames.append(frame)
+        return pd.concat(frames, ignore_index=True)
 
+    def run(self):
+        with open(self.dump_file) as f:
+            reference_responses = json.load(f)
+        urls = [self.clip_url(f['file_name']) for f in self.data]
+        missing = set()
+        if self.use_url:
+            missing = self.url_manifest.validate(
+                self.config.config['data'], self.base_url, urls,
+                self.session, self.download_concurrency, self.download_timeout
+            )
+        valid = [i for i, url in enumerate(urls) if url not in missing]
+        print("Fetching audio clips")
+        digests = [None] * len(urls)
+        for i, digest in zip(valid, self.fetch_clips([urls[i] for i in valid])):   # noqa
+            digests[i] = digest
+        self.dropped_idx = [i for i, digest in enumerate(digests) if digest is None]   # noqa
+        dropped_idx = set(self.dropped_idx)
+        print(f"Dropped {len(dropped_idx)} URLs. {len(urls) - len(dropped_idx)} URLs left") # noqa
+        reference_responses = [res for i, res in enumerate(reference_responses) if i not in dropped_idx]   # noqa
+        self.data = [res for i, res in enumerate(self.data) if i not in dropped_idx]
+        urls = [url for i, url in enumerate(urls) if i not in dropped_idx]
+        digests = [d for i, d in enumerate(digests) if i not in dropped_idx]
+        file_names = [f['file_name'] for f in self.data]
+        checkpoint = Checkpoint(
+            self.results_dump_file + '.partial.jsonl', resume=self.resume
+        )
+        hypotheses = {
+            engine: self.transcribe_engine(
+                engine, digests, urls, file_names, checkpoint
+            )
+            for engine in self.asr_engines
+        }
 
-def main(tier):
+        combined = []
+        for cohort, config in self.cohorts.items():
+            df = self.score_cohort(
+                cohort, hypotheses, reference_responses, file_names, checkpoint
+            )
+            # df['reference_response'] = reference_responses
+            df['audio_links'] = urls
+            df.to_csv(config.config['results_dump'], index=False)
+            self.dfs[cohort] = df
+            combined.append(self.combined_results(cohort, df, file_names))
+        self.df = self.dfs[self.cohort]
+        if self.combined_dump_file:
+            pd.concat(combined, ignore_index=True).to_csv(
+                self.combined_dump_file, index=False
+            )
+        checkpoint.remove()
+
+    def close(self):
+        """Close the SQLite stores opened for the run"""
+        self.hypothesis_cache.close()
+        self.audio_store.close()
+        for name, config in self.cohorts.items():
+            self.normalizers[name].close()
+            config.close()
+
+def main(tier, resume=False):
     config = Config(tier=tier, config_file='asr_config.yaml')
-    driver = Driver(config, cohort="1")
-    driver.run()
-
-    # config2 = Config(tier=tier, config_file='asr_config_nemo.yaml')
-    # driver2 = Driver(config2, cohort="2")
-    # driver2.run()
-
-    config3 = Config(tier=tier, config_file='asr_config_np.yaml')
-    driver3 = Driver(config3, cohort="3")
-    driver3.run()
+    cohorts = {
+        # "2": Config(tier=tier, config_file='asr_config_nemo.yaml'),
+        "3": Config(tier=tier, config_file='asr_config_np.yaml'),
+    }
+    driver = Driver(config, cohort="1", resume=resume, cohorts=cohorts)
+    try:
+        driver.run()
+    finally:
+        driver.close()
 
 def parse_args():
     parser = argparse.ArgumentParser()
@@ -358,6 +453,11 @@ def parse_args():
         required=True,
         help='tier on which to run the evaluation',
     )
+    parser.add_argument(
+        '--resume',
+        action='store_true',
+        help='reuse work recorded in the partial results of a previous run',
+    )
 
     return parser.parse_args()
 
@@ -365,5 +465,6 @@ def parse_args():
 if __name__ == '__main__':
     args = parse_args()
     main(
-        args.tier
+        args.tier,
+        args.resume
     )
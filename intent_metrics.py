@@ -0,0 +1,154 @@
+import numpy as np
+
+VALID_INTENTS = [
+    'payments_bill',
+    'small_talk_greeting',
+    'payments_transactions',
+    'no_intent',
+    'payments_navigation',
+]
+
+# Gold intent of utterances left out of intent scoring
+UNLABELED_INTENT = 'n/a'
+NO_INTENT = 'no_intent'
+
+
+class IntentScorer(object):
+    """Intent classification metrics from numpy confusion matrices.
+
+    Intents are mapped to integer codes through `codes`, seeded from the
+    configured intent labels. Labels seen for the first time (a new
+    intent returned by NLU, say) get the next free code instead of
+    failing. Every run, meaning one (cohort, engine) pair, is scored
+    against the same gold codes. All runs are counted with a single
+    `bincount` over a stacked (run, gold, predicted) index.
+    """
+
+    def __init__(self, labels=None):
+        self.labels = []
+        self.codes = {}
+        for label in labels or VALID_INTENTS:
+            self.code(label)
+
+    def code(self, label):
+        idx = self.codes.get(label)
+        if idx is None:
+            idx = self.codes[label] = len(self.labels)
+            self.labels.append(label)
+        return idx
+
+    def encode(self, labels):
+        return np.fromiter(
+            (self.code(label) for label in labels), dtype=np.int64
+        )
+
+    def gold(self, data):
+        """Indices of the scored utterances and their gold codes"""
+        keep = [
+            i for i, e in enumerate(data)
+            if e['labeled_intent'] != UNLABELED_INTENT
+        ]
+        return keep, self.encode(data[i]['labeled_intent'] for i in keep)
+
+    def predicted(self, responses, keep):
+        return self.encode(
+            responses[i]['intent'] or NO_INTENT for i in keep
+        )
+
+    def confusions(self, expected, predicted):
+        """(runs, n, n) counts of gold x predicted codes.
+
+        expected is an (utterances,) array shared by all runs, predicted a
+        (runs, utterances) array.
+        """
+        n = len(self.labels)
+        predicted = np.atleast_2d(predicted)
+        runs = predicted.shape[0]
+        index = (
+            np.arange(runs)[:, None] * n * n
+            + expected[None, :] * n
+            + predicted
+        )
+        counts = np.bincount(index.ravel(), minlength=runs * n * n)
+        return counts.reshape(runs, n, n)
+
+    def report(self, confusion):
+        """classification_report style dict of one confusion matrix.
+
+        Only labels present in the gold or predicted intents are listed,
+        with 'accuracy', 'micro avg', 'macro avg' and 'weighted avg'.
+        Undefined ratios are 0.
+        """
+        tp = np.diag(confusion).astype(float)
+        support = confusion.sum(axis=1)
+        predicted = confusion.sum(axis=0)
+        present = np.flatnonzero((support + predicted) > 0)
+        tp = tp[present]
+        support = support[present]
+        predicted = predicted[present]
+
+        precision = np.divide(
+            tp, predicted, out=np.zeros_like(tp), where=predicted > 0
+        )
+        recall = np.divide(
+            tp, support, out=np.zeros_like(tp), where=support > 0
+        )
+        total = precision + recall
+        f1 = np.divide(
+            2 * precision * recall, total,
+            out=np.zeros_like(tp), where=total > 0
+        )
+
+        out = {}
+        for k, idx in enumerate(present):
+            out[self.labels[idx]] = {
+                'precision': float(precision[k]),
+                'recall': float(recall[k]),
+                'f1-score': float(f1[k]),
+                'support': int(support[k]),
+            }
+        n_support = int(support.sum())
+        accuracy = float(tp.sum() / n_support) if n_support else 0.0
+        out['accuracy'] = accuracy
+        out['micro avg'] = {
+            'precision': accuracy,
+            'recall': accuracy,
+            'f1-score': accuracy,
+            'support': n_support,
+        }
+        out['macro avg'] = {
+            'precision': float(precision.mean()) if len(present) else 0.0,
+            'recall': float(recall.mean()) if len(present) else 0.0,
+            'f1-score': float(f1.mean()) if len(present) else 0.0,
+            'support': n_support,
+        }
+        weights = support / n_support if n_support else np.zeros_like(tp)
+        out['weighted avg'] = {
+            'precision': float(precision @ weights),
+            'recall': float(recall @ weights),
+            'f1-score': float(f1 @ weights),
+            'support': n_support,
+        }
+        return out
+
+    def score_runs(self, data, runs):
+        """Reports of several runs of predicted responses on the same data.
+
+        runs maps a run name, e.g. an engine, to its responses, aligned
+        with data.
+        """
+        keep, expected = self.gold(data)
+        names = list(runs)
+        predicted = [self.predicted(runs[name], keep) for name in names]
+        # Codes added while encoding the predictions widen the matrices
+        confusions = self.confusions(
+            expected,
+            np.stack(predicted) if predicted else np.empty((0, len(keep)), dtype=np.int64)  # noqa
+        )
+        return {
+            name: self.report(confusion)
+            for name, confusion in zip(names, confusions)
+        }
+
+    def score(self, data, responses):
+        return self.score_runs(data, {None: responses})[None]
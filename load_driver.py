@@ -0,0 +1,197 @@
+import os
+import json
+import argparse
+from time import perf_counter
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from utils import Config, response_pb2dict
+from asr_engines import IndicConformerEngine
+from mock_servers import LatencyModel, LATENCY_DISTRIBUTIONS, start_server
+
+
+def latency_summary(latencies, failures, elapsed):
+    """Throughput and latency percentiles of one load level"""
+    latencies = np.asarray(latencies, dtype=float)
+    requests_done = len(latencies) + failures
+    out = {
+        'requests': requests_done,
+        'failures': failures,
+        'seconds': elapsed,
+        'throughput': requests_done / elapsed if elapsed else 0.0,
+    }
+    for name, q in (('p50', 50), ('p95', 95), ('p99', 99)):
+        out[name] = float(np.percentile(latencies, q)) if len(latencies) else 0.0   # noqa
+    out['mean'] = float(latencies.mean()) if len(latencies) else 0.0
+    return out
+
+
+def load_asr(url, clips, concurrency):
+    """Transcribe clips with the IndicConformer adapter at url"""
+    engine = IndicConformerEngine(
+        'indic_conformer',
+        {'bhashini_ip': None, 'concurrency': {'indic_conformer': concurrency}},   # noqa
+        url=url
+    )
+    latencies = []
+    failures = 0
+
+    def work(content):
+        start = perf_counter()
+        try:
+            engine.transcribe(content, url)
+            return perf_counter() - start
+        except Exception:
+            return None
+
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for latency in executor.map(work, clips):
+            if latency is None:
+                failures += 1
+            else:
+                latencies.append(latency)
+    return latency_summary(latencies, failures, perf_counter() - start)
+
+
+def load_nlu(config, host, utterances, concurrency):
+    """text2intent requests for utterances against the server at host.
+
+    Each request goes through the client path of send_and_time_request
+    (template encoding, post_with_retry and response_pb2dict) without
+    the response cache or the capture store, and a non-200 answer counts
+    as a failure.
+    """
+    config.host = host
+    # Mock responses must never be written over a recorded capture
+    if config.capture is not None:
+        config.capture.close()
+    config.capture = None
+    config.config['nlu_client'] = dict(config.get_nlu_client(), retries=0)
+    config.session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=concurrency)
+    config.session.mount('http://', adapter)
+    template = config.get_request_template()
+
+    def work(text):
+        start = perf_counter()
+        try:
+            resp, _ = config.post_with_retry(template.encode(text))
+            if resp.status_code != 200:
+                return None
+            response_pb2dict(resp.content)
+            return perf_counter() - start
+        except Exception:
+            return None
+
+    latencies = []
+    failures = 0
+    start = perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for latency in executor.map(work, utterances):
+            if latency is None:
+                failures += 1
+            else:
+                latencies.append(latency)
+    return latency_summary(latencies, failures, perf_counter() - start)
+
+
+def main(tier, config_file, stages, levels, n, audio_bytes, distribution,
+         mean, sd, error_rate, seed, output):
+    config = Config(tier=tier, config_file=config_file)
+    with open(config.config['data']) as f:
+        data = json.load(f)
+    utterances = [
+        data[i % len(data)]['references'][0] for i in range(n)
+    ]
+    # Distinct clips so that nothing can be served from a cache
+    clips = [os.urandom(audio_bytes) for _ in range(n)]
+
+    results = []
+    for stage in stages:
+        kind = 'indic_conformer' if stage == 'asr' else 'text2intent'
+        latency = LatencyModel(distribution, mean, sd, error_rate, seed=seed)
+        server = start_server(kind, latency)
+        host = f"http://127.0.0.1:{server.server_port}"
+        try:
+            for concurrency in levels:
+                if stage == 'asr':
+                    summary = load_asr(host + '/recognize/en', clips, concurrency)   # noqa
+                else:
+                    summary = load_nlu(config, host, utterances, concurrency)
+                summary.update(stage=stage, concurrency=concurrency)
+                results.append(summary)
+                print(f"{stage:4s} concurrency {concurrency:3d}: {summary['throughput']:8.1f} req/s, p50 {summary['p50'] * 1000:7.1f} ms, p95 {summary['p95'] * 1000:7.1f} ms, p99 {summary['p99'] * 1000:7.1f} ms, {summary['failures']} failed")   # noqa
+        finally:
+            server.shutdown()
+
+    with open(output, 'w') as json_file:
+        json.dump({
+            'latency': {
+                'distribution': distribution,
+                'mean': mean,
+                'sd': sd,
+                'error_rate': error_rate,
+            },
+            'results': results,
+        }, json_file, indent=2)
+    config.close()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--tier',
+        choices=['local', 'stage', 'prod'],
+        default='local',
+        help='tier whose assistant id goes into the text2intent requests',
+    )
+    parser.add_argument('--config', default='asr_config.yaml')
+    parser.add_argument(
+        '--stages',
+        nargs='+',
+        choices=['asr', 'nlu'],
+        default=['asr', 'nlu'],
+    )
+    parser.add_argument(
+        '--concurrency',
+        nargs='+',
+        type=int,
+        default=[1, 4, 16],
+        help='in-flight request levels to measure',
+    )
+    parser.add_argument('-n', type=int, default=200, help='requests per level')   # noqa
+    parser.add_argument('--audio-bytes', type=int, default=64000)
+    parser.add_argument(
+        '--latency',
+        choices=LATENCY_DISTRIBUTIONS,
+        default='lognormal',
+    )
+    parser.add_argument('--mean', type=float, default=0.1, help='seconds')
+    parser.add_argument('--sd', type=float, default=0.05, help='seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='load_results.json')
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(
+        args.tier,
+        args.config,
+        args.stages,
+        args.concurrency,
+        args.n,
+        args.audio_bytes,
+        args.latency,
+        args.mean,
+        args.sd,
+        args.error_rate,
+        args.seed,
+        args.output
+    )
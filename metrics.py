@@ -1,116 +1,145 @@
-from copy import deepcopy
-from tqdm.notebook import tqdm
+from tqdm.auto import tqdm
 from collections import defaultdict
-from sklearn.preprocessing import LabelEncoder
-from sklearn.metrics import classification_report
+
+from intent_metrics import IntentScorer
+
+TRACKED_ENTITIES = frozenset([
+    'payments_bill_type',
+    'payments_bill_action',
+    'payments_navigation_target',
+    'payments_transaction_action',
+    'payments_name',
+    'payments_transaction_amount'
+])
+
 
 # to check word-wise tagging accuracy instead of looking at chunks
-def convert_gold_response_to_list(x, ignorelist, reprocesslist):
-    for entity in x['labeled_entities']:
+def normalize_gold_entities(labeled_entities, ignorelist=()):
+    """Word lists of the labeled entities, leaving the input untouched"""
+    out = {}
+    for entity, value in labeled_entities.items():
         if entity in ignorelist:
-            continue
-        if isinstance(x['labeled_entities'][entity], list):
-            x['labeled_entities'][entity] = [i.lower() for i in x['labeled_entities'][entity]]
-        elif isinstance(x['labeled_entities'][entity], dict):
-            composite_entity = []
-            for k, v in x['labeled_entities'][entity].items():
-                if isinstance(v, str):
-                    composite_entity.append(v.lower())
-                else:
-                    composite_entity.append(v)
-            x['labeled_entities'][entity] = composite_entity
+            out[entity] = value
+        elif isinstance(value, list):
+            out[entity] = [i.lower() for i in value]
+        elif isinstance(value, dict):
+            out[entity] = [
+                v.lower() if isinstance(v, str) else v for v in value.values()
+            ]
         else:
-            x['labeled_entities'][entity] = str(x['labeled_entities'][entity]).lower().split()
-    return x
-
-
-def convert_pred_response_to_list(x):
-    for entity in x['entities'][0]:
-        if isinstance(x['entities'][0][entity], str):
-            x['entities'][0][entity] = x['entities'][0][entity].lower().split()
-        elif isinstance(x['entities'][0][entity], list):
-            if len(x['entities'][0][entity]) >= 1:
-                if isinstance(x['entities'][0][entity][0], dict):
-                    continue
-            x['entities'][0][entity] = [
-                i.lower() for i in x['entities'][0][entity]
+            out[entity] = str(value).lower().split()
+    return out
+
+
+def normalize_pred_entities(entities):
+    """Word lists of the predicted entities, leaving the input untouched"""
+    out = {}
+    for entity, value in entities.items():
+        if isinstance(value, str):
+            value = value.lower().split()
+        elif isinstance(value, list):
+            if len(value) >= 1 and isinstance(value[0], dict):
+                pass
+            else:
+                value = [word for i in value for word in i.lower().split()]
+        elif isinstance(value, dict):
+            value = [
+                v.lower() if isinstance(v, str) else v for v in value.values()
             ]
+        elif isinstance(value, float):
+            value = [str(int(value))]
+        out[entity] = value
+    return out
 
-            temp_list = []
-            for i in x['entities'][0][entity]:
-                temp_list.extend(i.split())
-            x['entities'][0][entity] = temp_list
-        elif isinstance(x['entities'][0][entity], dict):
-            composite_entity = []
-            for k, v in x['entities'][0][entity].items():
-                if isinstance(v, str):
-                    composite_entity.append(v.lower())
-                else:
-                    composite_entity.append(v)
-            x['entities'][0][entity] = composite_entity
-        elif isinstance(x['entities'][0][entity], float):
-            x['entities'][0][entity] = [str(int(x['entities'][0][entity]))]
-    return x
-
-def find_true_tag(word, expected_entities):
-    for key, value in expected_entities.items():
-        if word.strip() in value:
-            return key
-    return "missing"
 
-def compute_entity_metrics(expected, predicted, debug):
-        counts = defaultdict(lambda: defaultdict(lambda: 0))
-        tracked_entities = [
-            'payments_bill_type',
-            'payments_bill_action',
-            'payments_navigation_target',
-            'payments_transaction_action',
-            'payments_name',
-            'payments_transaction_amount'
-        ]
-        errors = []
-        for idx, (e, p) in enumerate(tqdm(zip(expected, predicted))):
-            if e['labeled_intent'] != p['intent']:
-                continue
+def freeze(value):
+    """Hashable form of value; lists become tuples and dicts frozensets"""
+    if isinstance(value, (list, tuple)):
+        return tuple(freeze(v) for v in value)
+    if isinstance(value, dict):
+        return frozenset((k, freeze(v)) for k, v in value.items())
+    return value
+
 
-            p_entities = p['entities'][0]
-            e_entities = e['labeled_entities']
-
-            all_entities = set(p_entities.keys()) | set(e_entities.keys())
-            for entity in all_entities:
-                if entity not in tracked_entities:
-                    continue
-                if entity in p_entities and entity not in e_entities:
-                    counts[entity]['fp'] += len(p_entities[entity])
-                    error_string = f"{entity} predicted but not in expected"
-                    errors.append([e['index'], error_string])
-                elif entity not in p_entities and entity in e_entities:
-                    counts[entity]['fn'] += len(e_entities[entity])
-                    error_string = f"{entity} not predicted but in expected"
-                    errors.append([e['index'], error_string])
-                else:
-                    for val in p_entities[entity]:
-                        if val.lower() in e_entities[entity]:
-                            counts[entity]['tp'] += 1
-                        else:
-                            counts[entity]['fn'] += 1
-                            true_tag = find_true_tag(val, e_entities)
-                            counts[true_tag]['fp'] += 1
-                            error_string = f"{val} in {entity} is predicted but not in expected"  # noqa
-                            errors.append([e['index'], error_string])
+def index_gold_entities(expected_entities):
+    """Frozen word sets of the normalized gold entities and word -> entity.
 
+    A word listed under several entities maps to the first of them in
+    the order of expected_entities.
+    """
+    members = {}
+    owners = {}
+    for key, value in expected_entities.items():
+        words = frozenset(freeze(v) for v in value)
+        members[key] = words
+        for word in words:
+            owners.setdefault(word, key)
+    return members, owners
+
+
+class EntityMetrics(object):
+    """Streaming word-level entity precision, recall and F1.
+
+    `update` takes one (gold, predicted) response pair, normalizes copies
+    of its two entity maps and adds to the per-entity tp / fp / fn
+    counters, so only the counters outlive a pair. Pairs whose intents
+    differ are skipped.
+    """
+
+    def __init__(self, tracked_entities=TRACKED_ENTITIES, debug=False):
+        self.tracked_entities = tracked_entities
+        self.debug = debug
+        self.counts = defaultdict(lambda: defaultdict(lambda: 0))
+        self.errors = []
+        self.pairs = 0
+
+    def error(self, e, error_string):
+        if self.debug:
+            self.errors.append([e['index'], error_string])
+
+    def update(self, e, p):
+        self.pairs += 1
+        if e['labeled_intent'] != p['intent']:
+            return
+
+        counts = self.counts
+        p_entities = normalize_pred_entities(p['entities'][0])
+        e_entities = normalize_gold_entities(e['labeled_entities'])
+        members, owners = index_gold_entities(e_entities)
+
+        for entity in p_entities.keys() | e_entities.keys():
+            if entity not in self.tracked_entities:
+                continue
+            if entity in p_entities and entity not in e_entities:
+                counts[entity]['fp'] += len(p_entities[entity])
+                self.error(e, f"{entity} predicted but not in expected")
+            elif entity not in p_entities and entity in e_entities:
+                counts[entity]['fn'] += len(e_entities[entity])
+                self.error(e, f"{entity} not predicted but in expected")
+            else:
+                for val in p_entities[entity]:
+                    if val.lower() in members[entity]:
+                        counts[entity]['tp'] += 1
+                    else:
+                        counts[entity]['fn'] += 1
+                        true_tag = owners.get(val.strip(), "missing")
+                        counts[true_tag]['fp'] += 1
+                        self.error(e, f"{val} in {entity} is predicted but not in expected")  # noqa
+
+    def result(self):
         tp_sum = fp_sum = fn_sum = 0
-        for k, v in counts.items():
-            tp_sum += counts[k]['tp']
-            fp_sum += counts[k]['fp']
-            fn_sum += counts[k]['fn']
+        details = {}
+        for k, v in self.counts.items():
+            tp_sum += v['tp']
+            fp_sum += v['fp']
+            fn_sum += v['fn']
 
             try:
-                p = counts[k]['tp'] / (counts[k]['tp'] + counts[k]['fp'])
+                p = v['tp'] / (v['tp'] + v['fp'])
             except ZeroDivisionError:
                 p = 0
             try:
-                r = counts[k]['tp'] / (counts[k]['tp'] + counts[k]['fn'])
+                r = v['tp'] / (v['tp'] + v['fn'])
             except ZeroDivisionError:
                 r = 0
             try:
@@ -118,94 +147,59 @@ def compute_entity_metrics(expected, predicted, debug):
             except ZeroDivisionError:
                 f1 = 0
 
-            counts[k]['precision'] = p
-            counts[k]['recall'] = r
-            counts[k]['f1-score'] = f1
-            
-        details = {}
-        metrics = dict(counts)
-        for k, v in metrics.items():
-            details[k] = v['f1-score']
-            
-        overall_precision = tp_sum / (tp_sum + fp_sum)
-        overall_recall = tp_sum / (tp_sum + fn_sum)
-        overall_f1_score = 2 * overall_precision * overall_recall \
-            / (overall_precision + overall_recall)
-            
+            v['precision'] = p
+            v['recall'] = r
+            v['f1-score'] = f1
+            details[k] = f1
+
+        try:
+            overall_precision = tp_sum / (tp_sum + fp_sum)
+        except ZeroDivisionError:
+            overall_precision = 0
+        try:
+            overall_recall = tp_sum / (tp_sum + fn_sum)
+        except ZeroDivisionError:
+            overall_recall = 0
+        try:
+            overall_f1_score = 2 * overall_precision * overall_recall \
+                / (overall_precision + overall_recall)
+        except ZeroDivisionError:
+            overall_f1_score = 0
+
         return {
             'precision': overall_precision,
             'recall': overall_recall,
             'f1': overall_f1_score,
             'details': details,
         }
-    
+
+
+def compute_entity_metrics(expected, predicted, debug):
+    """Entity metrics of the (expected, predicted) pairs, consumed lazily"""
+    metrics = EntityMetrics(debug=debug)
+    for e, p in tqdm(zip(expected, predicted), desc='Scoring entities'):
+        metrics.update(e, p)
+    return metrics.result()
+
+
 def evaluate_entities(gold_responses, pred_responses, debug):
+    """Entity metrics of gold and predicted responses.
+
+    Both can be any iterables (e.g. generators reading a dump line by
+    line); they are walked once, in step, and never copied.
+    """
+    if hasattr(gold_responses, '__len__'):
         print('Evaluating entities (len: {})'.format(len(gold_responses)))
+    else:
+        print('Evaluating entities')
+
+    return compute_entity_metrics(gold_responses, pred_responses, debug)
+
+
+def evaluate_intents(data, vv_responses, labels=None):
+    return IntentScorer(labels).score(data, vv_responses)
+
 
-        preprocessed_pred = []
-        preprocessed_gold = []
-
-        tmp_pred = deepcopy(pred_responses)
-        tmp_gold = deepcopy(gold_responses)
-
-        for idx, response in enumerate(tqdm(
-                tmp_gold,
-                desc='Preprocessing gold'
-        )):
-            
-            preprocessed_gold.append(
-                convert_gold_response_to_list(
-                    response,
-                    ignorelist=[],
-                    reprocesslist=[],
-                )
-            )
-
-        for idx, response in enumerate(tqdm(
-                tmp_pred,
-                desc='Preprocessing predicted'
-        )):
-
-            preprocessed_pred.append(
-                convert_pred_response_to_list(response)
-            )
-
-        print('Finished pre-processing {} gold and {} predicted'.format(
-            len(preprocessed_gold),
-            len(preprocessed_pred),
-        ))
-
-        metrics = compute_entity_metrics(
-            preprocessed_gold,
-            preprocessed_pred,
-            debug
-        )
-        
-        return metrics
-    
-def evaluate_intents(data, vv_responses):
-    valid_intents = ['payments_bill', 
-                     'small_talk_greeting', 
-                     'payments_transactions', 
-                     'no_intent', 
-                     'payments_navigation' ]
-    predicted = []
-    expected = []
-    label_encoder = LabelEncoder()
-    for idx, (e, p) in enumerate(zip(data, vv_responses)):
-        if e['labeled_intent'] == 'n/a':
-            continue
-        predicted.append(p['intent'] if p['intent'] else 'no_intent')
-        expected.append(e['labeled_intent'])
-
-    label_encoder.fit_transform(valid_intents)
-    p_intents = label_encoder.transform(predicted)
-    e_intents = label_encoder.transform(expected)
-    target_names = label_encoder.inverse_transform(list(set(p_intents)))
-    d = classification_report(
-            e_intents,
-            p_intents,
-            digits=4,
-            output_dict=True
-        )
-    return d
\ No newline at end of file
+def evaluate_intent_runs(data, runs, labels=None):
+    """evaluate_intents of several runs (name -> responses) in one pass"""
+    return IntentScorer(labels).score_runs(data, runs)
@@ -0,0 +1,238 @@
+import re
+import math
+import json
+import time
+import base64
+import random
+import hashlib
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from slang_types_pb2 import SlangRequestPB, SlangResponsePB
+
+LATENCY_DISTRIBUTIONS = ('constant', 'uniform', 'normal', 'lognormal', 'exponential')   # noqa
+
+# Keyword -> intent rules of the mock text2intent, checked in order
+INTENT_KEYWORDS = [
+    ('bill', 'payments_bill'),
+    ('pay', 'payments_transactions'),
+    ('send', 'payments_transactions'),
+    ('request', 'payments_transactions'),
+    ('rupees', 'payments_transactions'),
+    ('offer', 'payments_navigation'),
+    ('show', 'payments_navigation'),
+    ('hello', 'small_talk_greeting'),
+    ('hi', 'small_talk_greeting'),
+]
+AMOUNT = re.compile(r'\d+(?:\.\d+)?')
+
+
+class LatencyModel(object):
+    """Service time and failure injection of a mock server.
+
+    `delay` draws a latency in seconds from the distribution, with `mean`
+    and `sd` (for uniform, the range is mean +/- sd; for lognormal they
+    are the mean and sd of the latency itself). `fails` is True with
+    probability error_rate. A seed makes runs repeatable.
+    """
+
+    def __init__(self, distribution='constant', mean=0.0, sd=0.0,
+                 error_rate=0.0, error_status=503, seed=None):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution '{distribution}'")   # noqa
+        self.distribution = distribution
+        self.mean = mean
+        self.sd = sd
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+    def sample(self):
+        r = self.random
+        if self.distribution == 'constant':
+            return self.mean
+        if self.distribution == 'uniform':
+            return r.uniform(self.mean - self.sd, self.mean + self.sd)
+        if self.distribution == 'normal':
+            return r.gauss(self.mean, self.sd)
+        if self.distribution == 'exponential':
+            return r.expovariate(1 / self.mean) if self.mean > 0 else 0.0
+        # lognormal with the given mean and sd of the latency
+        if self.mean <= 0:
+            return 0.0
+        sigma2 = math.log(1 + (self.sd / self.mean) ** 2)
+        mu = math.log(self.mean) - sigma2 / 2
+        return r.lognormvariate(mu, sigma2 ** 0.5)
+
+    def delay(self):
+        with self.lock:
+            return max(0.0, self.sample())
+
+    def fails(self):
+        with self.lock:
+            return self.random.random() < self.error_rate
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Room for a burst of concurrent clients before SYNs get dropped
+    request_queue_size = 128
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are separate writes; without this delayed ACKs
+    # add ~40 ms to every keep-alive request
+    disable_nagle_algorithm = True
+    latency = LatencyModel()
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def respond(self, body):
+        raise NotImplementedError
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.latency.delay())
+        if self.latency.fails():
+            self.send_body(self.latency.error_status, 'text/plain', b'mock error')   # noqa
+            return
+        try:
+            self.send_body(200, *self.respond(body))
+        except Exception as e:
+            self.send_body(400, 'text/plain', str(e).encode('utf-8'))
+
+
+class IndicConformerHandler(MockHandler):
+    """POST /recognize/<lang> with the IndicConformer JSON contract.
+
+    The transcript of a clip is looked up by the sha256 of its audio in
+    `transcripts`, and is a fixed placeholder otherwise.
+    """
+
+    transcripts = {}
+
+    def respond(self, body):
+        if not self.path.startswith('/recognize/'):
+            raise ValueError(f"Unknown path {self.path}")
+        request = json.loads(body)
+        audio = base64.b64decode(request['audio'][0]['audioContent'])
+        digest = hashlib.sha256(audio).hexdigest()
+        transcript = self.transcripts.get(digest, 'pay five hundred rupees to ravi')   # noqa
+        out = {'output': [{'source': transcript}]}
+        return 'application/json', json.dumps(out).encode('utf-8')
+
+
+class Text2IntentHandler(MockHandler):
+    """POST .../text2intent/ answering SlangRequestPB with SlangResponsePB.
+
+    The intent comes from INTENT_KEYWORDS, the last word is returned as
+    payments_name and the first number as a composite
+    payments_transaction_amount.
+    """
+
+    def respond(self, body):
+        request = SlangRequestPB()
+        request.ParseFromString(body)
+        text = request.text_request.text.lower()
+        words = text.split()
+
+        response = SlangResponsePB()
+        intent_response = response.intent_response
+        intent_response.intent_string = 'no_intent'
+        for keyword, intent in INTENT_KEYWORDS:
+            if keyword in words or (len(keyword) > 3 and keyword in text):
+                intent_response.intent_string = intent
+                break
+        if intent_response.intent_string == 'payments_transactions':
+            entity = intent_response.entities.add()
+            entity.key = 'payments_name'
+            entity.str_val = words[-1]
+            amount = AMOUNT.search(text)
+            if amount is not None:
+                entity = intent_response.entities.add()
+                entity.key = 'payments_transaction_amount'
+                entity.is_composite = True
+                value = entity.composite_values['std_money_amount']
+                value.str_val = str(float(amount.group(0)))
+                value = entity.composite_values['std_money_unit']
+                value.str_val = 'INR'
+        return 'application/octet-stream', response.SerializeToString()
+
+
+MOCK_HANDLERS = {
+    'indic_conformer': IndicConformerHandler,
+    'text2intent': Text2IntentHandler,
+}
+
+
+def start_server(kind, latency=None, host='127.0.0.1', port=0, **attrs):
+    """Serve a mock from a daemon thread and return the server.
+
+    port 0 picks a free port, see server.server_port.
+    """
+    attrs['latency'] = latency or LatencyModel()
+    handler = type('Handler', (MOCK_HANDLERS[kind],), attrs)
+    server = MockServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main(host, indic_port, t2i_port, distribution, mean, sd, error_rate,
+         seed):
+    servers = []
+    for kind, port in (('indic_conformer', indic_port), ('text2intent', t2i_port)):   # noqa
+        latency = LatencyModel(distribution, mean, sd, error_rate, seed=seed)
+        servers.append(start_server(kind, latency, host, port))
+        print(f"Mock {kind} on http://{host}:{servers[-1].server_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        for server in servers:
+            server.shutdown()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--indic-port', type=int, default=4992)
+    parser.add_argument('--t2i-port', type=int, default=8083)
+    parser.add_argument(
+        '--latency',
+        choices=LATENCY_DISTRIBUTIONS,
+        default='lognormal',
+        help='distribution of the service time of every request',
+    )
+    parser.add_argument('--mean', type=float, default=0.1, help='seconds')
+    parser.add_argument('--sd', type=float, default=0.05, help='seconds')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=None)
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(
+        args.host,
+        args.indic_port,
+        args.t2i_port,
+        args.latency,
+        args.mean,
+        args.sd,
+        args.error_rate,
+        args.seed
+    )
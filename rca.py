@@ -1,22 +1,27 @@
 import pandas as pd
 
-df1 = pd.read_csv('ASR_quality_metrics_1.csv')
-df2 = pd.read_csv('ASR_quality_metrics_2.csv')
-df3 = pd.read_csv('ASR_quality_metrics_3.csv')
+# Column prefixes of the transcriptions and references of every cohort
+TRANSCRIPTION_PREFIX = {'1': 'raw', '2': 'nemo', '3': 'np'}
+REFERENCE_COLUMN = {'2': 'nemo', '3': 'number_parser'}
+
+results = pd.read_csv('ASR_quality_metrics.csv', dtype={'cohort': str})
+cohorts = list(dict.fromkeys(results['cohort']))
+engines = list(dict.fromkeys(results['engine']))
+by_run = {
+    (cohort, engine): group.reset_index(drop=True)
+    for (cohort, engine), group in results.groupby(['cohort', 'engine'])
+}
 
 combined_df = pd.DataFrame()
-combined_df['raw'] = df1['References']
-combined_df['nemo'] = df2['transformed_references']
-combined_df['number_parser'] = df3['transformed_references']
-combined_df['raw_indic_conformer'] = df1['indic_conformer_transcription']
-combined_df['raw_google_speech'] = df1['google_speech_transcription']
-combined_df['raw_slang_google_speech'] = df1['slang_google_speech_transcription']
-combined_df['nemo_indic_conformer'] = df2['indic_conformer_transcription']
-combined_df['nemo_google_speech'] = df2['google_speech_transcription']
-combined_df['nemo_slang_google_speech'] = df2['slang_google_speech_transcription']
-combined_df['np_indic_conformer'] = df3['indic_conformer_transcription']
-combined_df['np_google_speech'] = df3['google_speech_transcription']
-combined_df['np_slang_google_speech'] = df3['slang_google_speech_transcription']
+combined_df['raw'] = by_run[(cohorts[0], engines[0])]['references']
+for cohort in cohorts:
+    if cohort in REFERENCE_COLUMN:
+        references = by_run[(cohort, engines[0])]['transformed_references']
+        combined_df[REFERENCE_COLUMN[cohort]] = references
+for cohort in cohorts:
+    prefix = TRANSCRIPTION_PREFIX.get(cohort, cohort)
+    for engine in engines:
+        transcription = by_run[(cohort, engine)]['transcription']
+        combined_df[prefix + '_' + engine] = transcription
 
 combined_df.to_csv('rca_new.csv', index=False)
-
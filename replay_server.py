@@ -0,0 +1,76 @@
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from capture_store import CaptureStore
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    """Answers text2intent POSTs with the responses of a CaptureStore"""
+
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    store = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_body(self, status, content_type, body):
+        self.send_response(status)
+        if content_type:
+            self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        try:
+            key = CaptureStore.nlu_key(self.path, body)
+        except Exception as e:
+            self.send_body(400, 'text/plain', str(e).encode('utf-8'))
+            return
+        exchange = self.store.get('nlu', key)
+        if exchange is None:
+            self.send_body(404, 'text/plain', b'not captured')
+            return
+        self.send_body(*exchange)
+
+
+def start_server(store, host='127.0.0.1', port=8090):
+    """Serve store on host:port from a daemon thread and return the server"""
+    handler = type('Handler', (ReplayHandler,), {'store': store})
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main(capture, host, port):
+    with CaptureStore(capture, mode='replay') as store:
+        print(f"Replaying {store.count('nlu')} text2intent responses on http://{host}:{port}")   # noqa
+        handler = type('Handler', (ReplayHandler,), {'store': store})
+        ThreadingHTTPServer((host, port), handler).serve_forever()
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        '--capture',
+        default='capture.sqlite',
+        help='capture archive recorded by evaluate_asr.py',
+    )
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+
+    return parser.parse_args()
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    main(
+        args.capture,
+        args.host,
+        args.port
+    )
@@ -1,35 +1,60 @@
+from collections import Counter
+
+from metrics import freeze
+
 
 class SlangMetrics:
+    """Entity-level agreement between two NLU responses.
+
+    A response's entities are flattened into (key, value) items, one per
+    element of a list value, and frozen so that they hash (nested dicts
+    become frozensets of their items). Strings are lowercased and unset
+    composite fields dropped first, so that gold and predicted values
+    compare alike. Each side is kept as a Counter of items, which makes
+    the score linear in the number of entities.
+    """
 
     def response_subtract(self, A, B):
-        result = []
-        for i in A:
-            if i not in B:
-                result.append(i)
-        return result
+        B = set(self.canonical(B))
+        return [i for i in A if self.freeze_item(i) not in B]
 
     def response_add(self, A, B):
-        out = []
-        for i in A+B:
-            if i not in out:
-                out.append(i)
-        return out
+        out = {}
+        for i in A + B:
+            out.setdefault(self.freeze_item(i), i)
+        return list(out.values())
 
-    def slang_accuracy_score(self, A, B):
-        A_minus_B = self.response_subtract(A, B)
-        B_minus_A = self.response_subtract(B, A)
-        A_plus_B = self.response_add(A, B)
-        numerator = (len(A_minus_B) + len(B_minus_A))
-        denominator = len(A_plus_B)
+    @staticmethod
+    def freeze_item(item):
+        return freeze(item)
+
+    def canonical(self, items):
+        return Counter(self.freeze_item(i) for i in items)
+
+    def multiset_score(self, A, B):
+        """1 - (|A - B| + |B - A|) / |distinct(A + B)| of two Counters.
+
+        An item missing from the other side counts once per occurrence,
+        like in slang_accuracy_score.
+        """
+        numerator = sum(n for i, n in A.items() if i not in B)
+        numerator += sum(n for i, n in B.items() if i not in A)
         if numerator == 0:
-            score = 0
-        else:
-            score = numerator / denominator
-        return 1 - score
+            return 1
+        return 1 - numerator / len(A.keys() | B.keys())
+
+    def slang_accuracy_score(self, A, B):
+        return self.multiset_score(self.canonical(A), self.canonical(B))
+
+    def entities(self, response):
+        """Entity map of a predicted response or of a gold reference"""
+        if 'entities' in response:
+            return response['entities'][0]
+        return response.get('labeled_entities', {})
 
     def preprocess_entity_response(self, response):
         out = []
-        for k, v in response['entities'][0].items():
+        for k, v in self.entities(response).items():
             if isinstance(v, list):
                 for val in v:
                     out.append({k: val})
@@ -37,14 +62,52 @@ class SlangMetrics:
                 out.append({k: v})
         return out
 
+    def normalize_value(self, value):
+        """value with strings lowercased and None composite fields dropped"""
+        if isinstance(value, str):
+            return value.lower()
+        if isinstance(value, list):
+            return [self.normalize_value(v) for v in value]
+        if isinstance(value, dict):
+            return {
+                k: self.normalize_value(v)
+                for k, v in value.items() if v is not None
+            }
+        return value
+
+    def entity_counter(self, response, keys=None):
+        """Counter of the frozen (key, value) items of response's entities"""
+        out = Counter()
+        for k, v in self.entities(response).items():
+            if keys is not None and k not in keys:
+                continue
+            for val in (v if isinstance(v, list) else [v]):
+                val = self.normalize_value(val)
+                out[frozenset([(k, freeze(val))])] += 1
+        return out
+
     def compute_translation_score(self, response_1, response_2):
-        response_1 = self.preprocess_entity_response(response_1)
-        response_2 = self.preprocess_entity_response(response_2)
-        score = self.slang_accuracy_score(response_1, response_2)
-        return score
+        return self.multiset_score(
+            self.entity_counter(response_1), self.entity_counter(response_2)
+        )
 
     def compute_asr_score(self, response_1, response_2):
-        response_1 = self.preprocess_entity_response(response_1)
-        response_2 = self.preprocess_entity_response(response_2)
-        score = self.slang_accuracy_score(response_1, response_2)
-        return score
+        return self.multiset_score(
+            self.entity_counter(response_1), self.entity_counter(response_2)
+        )
+
+    def score_columns(self, expected, columns, keys=None):
+        """compute_asr_score of every column of responses against expected.
+
+        columns maps a name (an engine) to responses aligned with expected.
+        Each expected response is flattened once for all columns. Only
+        entities in keys are compared when it is given.
+        """
+        gold = [self.entity_counter(e, keys) for e in expected]
+        return {
+            name: [
+                self.multiset_score(g, self.entity_counter(p, keys))
+                for g, p in zip(gold, responses)
+            ]
+            for name, responses in columns.items()
+        }
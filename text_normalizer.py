@@ -0,0 +1,242 @@
+import re
+import multiprocessing
+
+from slanglabs_nlu.entity_extraction.parsers import parse_numbers
+
+from asr_cache import SQLiteStore
+
+SPECIAL_CHARS = re.compile(r'[!"#$*,\/;<=>?[\]^_`{|}~.]+')
+PARENTHESES = re.compile(r'[()]')
+
+ITN_LANGUAGE = 'en'
+
+# (signature, text) -> normalized text, shared by every pipeline
+_memo = {}
+
+# InverseNormalizer of the current process, built on first use
+_inverse_normalizer = None
+
+
+def normalize_str(string):
+    string = SPECIAL_CHARS.sub('', string)  # Remove special characters
+    string = PARENTHESES.sub(' ', string)
+    return string.strip().lower()
+
+
+def apply_number_parser(text):
+    """Replace the number spans found by parse_numbers with their values.
+
+    The text is rebuilt in a single left-to-right pass over the spans
+    (start and end are inclusive), so only the parsed occurrences are
+    replaced. A span overlapping an earlier one is skipped.
+    """
+    numbers = sorted(parse_numbers(text), key=lambda number: number[1][0])
+    if not numbers:
+        return text
+    parts = []
+    position = 0
+    for value, (start_idx, end_idx) in numbers:
+        if start_idx < position:
+            continue
+        parts.append(text[position:start_idx])
+        parts.append(str(value))
+        position = end_idx + 1
+    parts.append(text[position:])
+    return ''.join(parts)
+
+
+def apply_number_parser_batch(texts):
+    """apply_number_parser over texts, parsing each unique string once"""
+    out = {text: apply_number_parser(text) for text in dict.fromkeys(texts)}
+    return [out[text] for text in texts]
+
+
+def get_inverse_normalizer():
+    """The NeMo InverseNormalizer of this process.
+
+    Compiling the grammar takes a long time, so it is done once per process
+    (the driver, or each ITN pool worker) and only when ITN is needed.
+    """
+    global _inverse_normalizer
+    if _inverse_normalizer is None:
+        from nemo_text_processing.inverse_text_normalization.inverse_normalize import InverseNormalizer  # noqa
+        _inverse_normalizer = InverseNormalizer(lang=ITN_LANGUAGE)
+    return _inverse_normalizer
+
+
+def _itn_worker_init():
+    get_inverse_normalizer()
+
+
+def _itn_worker(text):
+    try:
+        return get_inverse_normalizer().inverse_normalize(text, verbose=False)
+    except Exception as e:
+        print('Exception caught', e)
+        return None
+
+
+class ITNCache(SQLiteStore):
+    """Persistent store of NeMo ITN outputs backed by SQLite, keyed by text"""
+
+    schema = (
+        'CREATE TABLE IF NOT EXISTS itn ('
+        'language TEXT NOT NULL, '
+        'text TEXT NOT NULL, '
+        'normalized TEXT NOT NULL, '
+        'PRIMARY KEY (language, text))'
+    )
+
+    def __init__(self, path=':memory:', language=ITN_LANGUAGE):
+        super().__init__(path)
+        self.language = language
+
+    def get(self, text):
+        row = self.fetchone(
+            'SELECT normalized FROM itn WHERE language = ? AND text = ?',
+            (self.language, text)
+        )
+        if row is None:
+            return None
+        return row[0]
+
+    def get_many(self, texts):
+        """dict of text -> ITN output for the cached texts"""
+        out = {}
+        texts = list(texts)
+        # Stay under SQLite's limit on bound parameters
+        for start in range(0, len(texts), 500):
+            chunk = texts[start:start + 500]
+            out.update(self.fetchall(
+                'SELECT text, normalized FROM itn WHERE language = ? '
+                'AND text IN (%s)' % ','.join('?' * len(chunk)),
+                [self.language] + chunk
+            ))
+        return out
+
+    def put_many(self, items):
+        self.write_many(
+            'INSERT OR REPLACE INTO itn VALUES (?, ?, ?)',
+            [(self.language, text, out) for text, out in items]
+        )
+
+
+class TextNormalizer(object):
+    """Text normalization pipeline built once per config.
+
+    The enabled stages (slang normalizer, NeMo inverse text normalization
+    and number parser) run in that order. Their names form the pipeline
+    signature, and outputs are memoized per (signature, input) so a string
+    is only normalized once per pipeline, whichever Driver asks for it.
+
+    NeMo ITN outputs are also kept in an ITNCache, and `transform_batch`
+    runs ITN over all the unique uncached strings with a pool of
+    `itn_workers` processes, each loading the grammar once.
+    """
+
+    def __init__(self, use_slang_normalizer=True, use_nemo=False,
+                 use_number_parser=False, itn_cache=None, itn_workers=1,
+                 itn_chunksize=16):
+        self.stages = []
+        self.itn_cache = None
+        self.itn_workers = max(1, int(itn_workers))
+        self.itn_chunksize = itn_chunksize
+        if use_slang_normalizer:
+            self.stages.append(('slang_normalizer', normalize_str))
+        if use_nemo:
+            self.itn_cache = ITNCache(itn_cache or ':memory:')
+            self.stages.append(('nemo', self.inverse_normalize))
+        if use_number_parser:
+            self.stages.append(('number_parser', apply_number_parser))
+        self.signature = tuple(name for name, _ in self.stages)
+
+    @classmethod
+    def from_config(cls, config):
+        itn = config.get('itn') or {}
+        return cls(
+            use_slang_normalizer=config['use_slang_normalizer'],
+            use_nemo=config['use_nemo'],
+            use_number_parser=config['use_number_parser'],
+            itn_cache=itn.get('cache'),
+            itn_workers=itn.get('workers', 1),
+            itn_chunksize=itn.get('chunksize', 16),
+        )
+
+    def inverse_normalize(self, text):
+        out = self.itn_cache.get(text)
+        if out is None:
+            out = get_inverse_normalizer().inverse_normalize(text, verbose=False)   # noqa
+            self.itn_cache.put_many([(text, out)])
+        return out
+
+    def inverse_normalize_batch(self, texts):
+        """dict of text -> ITN output; texts that failed are left out"""
+        texts = list(dict.fromkeys(texts))
+        out = self.itn_cache.get_many(texts)
+        missing = [text for text in texts if text not in out]
+        if not missing:
+            return out
+        print(f"Running ITN on {len(missing)} strings")
+        if self.itn_workers > 1 and len(missing) > self.itn_chunksize:
+            # The driver has live threads and gRPC channels by now, which
+            # do not survive a fork
+            context = multiprocessing.get_context('spawn')
+            with context.Pool(self.itn_workers, initializer=_itn_worker_init) as pool:   # noqa
+                results = pool.map(
+                    _itn_worker, missing, chunksize=self.itn_chunksize
+                )
+        else:
+            results = [_itn_worker(text) for text in missing]
+        done = [(t, r) for t, r in zip(missing, results) if r is not None]
+        self.itn_cache.put_many(done)
+        out.update(done)
+        return out
+
+    def close(self):
+        if self.itn_cache is not None:
+            self.itn_cache.close()
+
+    def __call__(self, text):
+        key = (self.signature, text)
+        out = _memo.get(key)
+        if out is None:
+            out = text
+            for _, stage in self.stages:
+                out = stage(out)
+            _memo[key] = out
+        return out
+
+    def transform_batch(self, texts):
+        """Normalize texts stage by stage, running ITN as one batch.
+
+        Outputs are memoized like in `__call__`. Texts that fail at some
+        stage map to None here and are left out of the memo, so calling
+        the normalizer on them raises as usual.
+        """
+        pending = list(dict.fromkeys(
+            text for text in texts if (self.signature, text) not in _memo
+        ))
+        current = dict(zip(pending, pending))
+        for name, stage in self.stages:
+            if name == 'nemo':
+                done = self.inverse_normalize_batch(current.values())
+                outputs = {t: done.get(out) for t, out in current.items()}
+            elif name == 'number_parser':
+                try:
+                    done = apply_number_parser_batch(list(current.values()))
+                    outputs = dict(zip(current, done))
+                except Exception as e:
+                    print('Exception caught', e)
+                    outputs = {}
+            else:
+                outputs = {}
+                for text, out in current.items():
+                    try:
+                        outputs[text] = stage(out)
+                    except Exception as e:
+                        print('Exception caught', e)
+                        outputs[text] = None
+            current = {t: o for t, o in outputs.items() if o is not None}
+        for text, out in current.items():
+            _memo[(self.signature, text)] = out
+        return [_memo.get((self.signature, text)) for text in texts]
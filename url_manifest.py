@@ -0,0 +1,91 @@
+import os
+import json
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from tqdm import tqdm
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def url_exists(session, url, timeout=30):
+    """Check url with a HEAD, falling back to a one byte ranged GET.
+
+    Returns None when the check itself failed, e.g. on a timeout.
+    """
+    try:
+        response = session.head(url, allow_redirects=True, timeout=timeout)
+        if response.status_code in (403, 405, 501):
+            response = session.get(
+                url, headers={'Range': 'bytes=0-0'}, stream=True,
+                timeout=timeout
+            )
+            response.close()
+        return response.status_code in (200, 206)
+    except Exception as e:
+        print('Could not validate', url, e)
+        return None
+
+
+class UrlManifest(object):
+    """Per-dataset record of which clip URLs are missing.
+
+    The manifest is a JSON file mapping a dataset path to the sha256 of
+    the dataset file, the base URL and the missing URLs found when it was
+    last validated. An entry is reused as long as both still match.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.entries = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+
+    def missing(self, dataset, base_url):
+        """Missing URLs recorded for dataset, or None if it is stale"""
+        entry = self.entries.get(dataset)
+        if entry is None or not os.path.exists(dataset):
+            return None
+        if entry['base_url'] != base_url:
+            return None
+        if entry['sha256'] != file_sha256(dataset):
+            return None
+        return set(entry['missing'])
+
+    def update(self, dataset, base_url, missing):
+        with self.lock:
+            self.entries[dataset] = {
+                'sha256': file_sha256(dataset),
+                'base_url': base_url,
+                'missing': sorted(missing),
+            }
+            if self.path is not None:
+                with open(self.path, 'w') as f:
+                    json.dump(self.entries, f, indent=4)
+
+    def validate(self, dataset, base_url, urls, session, workers=16,
+                 timeout=30):
+        """Set of urls that do not exist, validated concurrently"""
+        missing = self.missing(dataset, base_url)
+        if missing is not None:
+            print(f"Reusing URL manifest for {dataset}")
+            return missing
+
+        print("Checking and dropping wrong URLs")
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+            results = executor.map(
+                lambda url: url_exists(session, url, timeout), urls
+            )
+            exists = list(tqdm(results, total=len(urls)))
+        missing = {url for url, ok in zip(urls, exists) if ok is False}
+        self.update(dataset, base_url, missing)
+        return missing
@@ -1,8 +1,12 @@
 import re
+import json
+import time
 import random
+import hashlib
 import requests
 import yaml
 from tqdm import tqdm
+from concurrent.futures import ThreadPoolExecutor
 
 from google.protobuf.json_format import MessageToDict
 
@@ -13,6 +17,9 @@ except NameError:
                                  SlangRequestPB, SlangContextItemPB)
 from time import perf_counter
 
+from asr_cache import SQLiteStore
+from capture_store import CaptureStore
+
 
 # helper functions
 def create_pb_request(assistant_id, input, etfs=[], iname='', lang='en-IN'):
@@ -35,6 +42,97 @@ def create_pb_request(assistant_id, input, etfs=[], iname='', lang='en-IN'):
     return request.SerializeToString()
 
 
+def encode_varint(value):
+    if value < 0x80:
+        return bytes((value,))
+    out = bytearray()
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def varint_size(value):
+    size = 1
+    while value > 0x7f:
+        value >>= 7
+        size += 1
+    return size
+
+
+class RequestTemplate(object):
+    """Pre-serialized create_pb_request for one assistant.
+
+    The request type and the header fields that are the same for every
+    utterance (app_id, language, auth_token and context stack) are
+    serialized once. `encode` then only appends the request_id,
+    session_id and text fields, with their varint lengths, to those
+    bytes. Fields may come out of field-number order, which protobuf
+    parsers accept; the parsed request is the same as
+    create_pb_request's. Lengths are computed up front so a request is a
+    single join of byte strings.
+    """
+
+    # Field numbers of SlangRequestPB.text_request, SlangTextRequestPB's
+    # header and text, and the header's request_id and session_id
+    TEXT_REQUEST = 3
+    HEADER = 1
+    TEXT = 2
+    REQUEST_ID = 2
+    SESSION_ID = 5
+
+    def __init__(self, assistant_id, etfs=[], iname='', lang='en-IN'):
+        request = SlangRequestPB()
+        request.type = REQUEST_TEXT
+        self.prefix = request.SerializeToString()
+
+        header = request.text_request.header
+        header.app_id = assistant_id
+        header.language = lang
+        header.auth_token = ''
+        if len(etfs) > 0:
+            ctx_item = SlangContextItemPB()
+            ctx_item.intent_string = iname
+            ctx_item.entities_to_resolve.extend(etfs)
+            header.context.stack.extend([ctx_item])
+        self.header = header.SerializeToString()
+        # Every appended field has a one byte tag
+        self.header_length = len(self.header) + 2
+        self.prefix += encode_varint(self.TEXT_REQUEST << 3 | 2)
+        self.header_tag = encode_varint(self.HEADER << 3 | 2)
+        self.text_tag = encode_varint(self.TEXT << 3 | 2)
+        self.request_id_tag = encode_varint(self.REQUEST_ID << 3 | 2)
+        self.session_id_tag = encode_varint(self.SESSION_ID << 3 | 2)
+
+    def encode(self, input, request_id=None, session_id=None):
+        if request_id is None:
+            request_id = str(random.randint(10, 1000))
+        if session_id is None:
+            session_id = str(random.randint(10, 1000))
+        request_id = request_id.encode('utf-8')
+        session_id = session_id.encode('utf-8')
+        text = input.encode('utf-8')
+        header_length = (
+            self.header_length + len(request_id) + len(session_id)
+            + varint_size(len(request_id)) + varint_size(len(session_id))
+        )
+        text_request_length = (
+            2 + header_length + varint_size(header_length)
+            + len(text) + varint_size(len(text))
+        )
+        return b''.join((
+            self.prefix, encode_varint(text_request_length),
+            self.header_tag, encode_varint(header_length), self.header,
+            self.request_id_tag, encode_varint(len(request_id)), request_id,
+            self.session_id_tag, encode_varint(len(session_id)), session_id,
+            self.text_tag, encode_varint(len(text)), text,
+        ))
+
+    def encode_batch(self, inputs):
+        return [self.encode(input) for input in inputs]
+
+
 def parse_list_value(e):
     ret = []
     for item in e.get('listValues', []):
@@ -59,7 +157,8 @@ def parse_composite_value(e):
     return ret
 
 
-def response_pb2dict(pbstr):
+def response_pb2dict_json(pbstr):
+    """response_pb2dict through MessageToDict, kept as its reference"""
     resp_pb = SlangResponsePB()
     resp_pb.ParseFromString(pbstr)
     response = MessageToDict(resp_pb)
@@ -82,6 +181,97 @@ def response_pb2dict(pbstr):
     return {'intent': intent, 'entities': [emap]}
 
 
+def entity_pb_value(e):
+    """Value of a SlangEntityPB: a list, a dict or its str_val"""
+    if e.is_list:
+        return [entity_pb_value(item) for item in e.list_values]
+    if e.is_composite:
+        return {k: entity_pb_value(v) for k, v in e.composite_values.items()}
+    return e.str_val
+
+
+def response_pb2dict(pbstr):
+    """Intent and entities of a serialized SlangResponsePB.
+
+    Reads the fields straight from the parsed message instead of going
+    through MessageToDict; the output is the same as
+    response_pb2dict_json's.
+    """
+    resp_pb = SlangResponsePB()
+    resp_pb.ParseFromString(pbstr)
+
+    if not resp_pb.HasField('intent_response'):
+        return {}
+
+    intent_response = resp_pb.intent_response
+    emap = {}
+    for e in intent_response.entities:
+        emap[e.key] = entity_pb_value(e)
+
+    return {'intent': intent_response.intent_string, 'entities': [emap]}
+
+
+def failed_response():
+    """Stand-in for a text2intent request that never got a 200"""
+    return {'intent': '', 'entities': [{}], 'failed': True}
+
+
+class NLUResponseCache(SQLiteStore):
+    """Persistent memo of raw text2intent responses.
+
+    Responses are keyed by the normalized utterance, assistant id, env
+    and version, and stored as the serialized SlangResponsePB so a hit
+    goes through the same response_pb2dict path as a live request. Once
+    the cache holds more than `max_entries` responses the least recently
+    used ones are evicted.
+    """
+
+    schema = (
+        'CREATE TABLE IF NOT EXISTS responses ('
+        'key TEXT PRIMARY KEY, '
+        'response BLOB NOT NULL, '
+        'last_used REAL NOT NULL)'
+    )
+
+    def __init__(self, path=':memory:', max_entries=100000):
+        super().__init__(path)
+        self.max_entries = max_entries
+        self.count = self.fetchone('SELECT COUNT(*) FROM responses')[0]
+
+    @staticmethod
+    def make_key(text, assistant_id, env, version):
+        encoded = json.dumps([text, assistant_id, env, version])
+        return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        row = self.fetchone(
+            'SELECT response FROM responses WHERE key = ?', (key,)
+        )
+        if row is None:
+            return None
+        self.write(
+            'UPDATE responses SET last_used = ? WHERE key = ?',
+            (time.time(), key)
+        )
+        return row[0]
+
+    def put(self, key, response):
+        with self.lock:
+            cursor = self.conn.execute(
+                'INSERT OR IGNORE INTO responses VALUES (?, ?, ?)',
+                (key, response, time.time())
+            )
+            self.count += cursor.rowcount
+            if self.count > self.max_entries:
+                self.conn.execute(
+                    'DELETE FROM responses WHERE key IN ('
+                    'SELECT key FROM responses ORDER BY last_used LIMIT ?)',
+                    (self.count - self.max_entries,)
+                )
+                self.count = self.max_entries
+            self.conn.commit()
+
+
 # preprocessing functions for splitting every entity to a list. this helps us
 # to check word-wise tagging accuracy instead of looking at chunks
 def convert_gold_response_to_list(config, x, ignorelist, reprocesslist):
@@ -155,12 +345,38 @@ class Config(object):
         self.reference_dump_file = common.get('reference_dump', '')
         self.results_dump_file = common.get('results_dump', '')
         self.config = common
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=self.get_nlu_concurrency()
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.request_template = None
+        capture = self.config.get('capture') or {}
+        self.capture = None
+        if capture.get('mode', 'off') != 'off':
+            self.capture = CaptureStore(
+                capture.get('path', 'capture.sqlite'), capture['mode']
+            )
+            if self.capture.replaying:
+                # text2intent is answered by replay_server.py
+                self.host = capture.get('replay_host', 'http://localhost:8090')   # noqa
+        nlu_cache = self.config.get('nlu_cache', {})
+        self.nlu_cache = NLUResponseCache(
+            nlu_cache.get('path') or ':memory:',
+            nlu_cache.get('max_entries', 100000)
+        )
 
     def __str__(self):
         return "tier: {}".format(
             self.tier
         )
 
+    def close(self):
+        self.nlu_cache.close()
+        if self.capture is not None:
+            self.capture.close()
+
     def get_dataset(self):
         return self.config.get('dataset', None)
 
@@ -188,6 +404,17 @@ class Config(object):
     def get_normalized_entities(self):
         return self.get_nlu().get('entities', {}).get('normalized', [])
 
+    def get_nlu_client(self):
+        return self.config.get('nlu_client', {})
+
+    def get_request_template(self):
+        if self.request_template is None:
+            self.request_template = RequestTemplate(self.get_id())
+        return self.request_template
+
+    def get_nlu_concurrency(self):
+        return max(1, int(self.get_nlu_client().get('concurrency', 1)))
+
     def get_identifiers(self):
         m = self.config.get('tiers', {}).get(self.tier, {})
         return m['id'], m['key'], m['env'], m['version']
@@ -236,22 +463,124 @@ class Config(object):
         string = re.sub(r'[()]', ' ', string)
         return string.strip().lower()
 
-    def send_and_time_request(self, utterances):
-        pred_responses = []
-        response_times = []
-
-        # Request to load model
-        req = create_pb_request(self.get_id(), "dummy")
-        resp = requests.post(self.get_t2i_url(), data=req, auth=self.get_auth())   # noqa
-
-        for idx, res in enumerate(tqdm(utterances)):
+    def post_with_retry(self, data):
+        """POST a text2intent request, retrying with exponential backoff.
+
+        Connection errors, 429s and 5xx responses are retried. Returns the
+        last response and the latency of that attempt alone.
+        """
+        client = self.get_nlu_client()
+        retries = client.get('retries', 3)
+        backoff = client.get('backoff', 0.5)
+        timeout = client.get('timeout', 30)
+        for attempt in range(retries + 1):
             start = perf_counter()
-            req = create_pb_request(self.get_id(), self.normalize_str(res))
-            resp = requests.post(self.get_t2i_url(), data=req, auth=self.get_auth())  # noqa
-            response_time = perf_counter() - start
-            response_times.append(response_time)
-            response = response_pb2dict(resp.content)
-            response['text'] = res
-            response['entities'][0].pop('unrecognised_words', '')
-            pred_responses.append(response)
+            try:
+                resp = self.session.post(
+                    self.get_t2i_url(),
+                    data=data,
+                    auth=self.get_auth(),
+                    timeout=timeout
+                )
+                response_time = perf_counter() - start
+                if resp.status_code != 429 and resp.status_code < 500:
+                    if resp.status_code == 200:
+                        self.record_nlu(
+                            data, resp.status_code,
+                            resp.headers.get('Content-Type'), resp.content
+                        )
+                    return resp, response_time
+            except requests.RequestException:
+                if attempt == retries:
+                    raise
+            if attempt < retries:
+                time.sleep(backoff * 2 ** attempt)
+        return resp, response_time
+
+    def record_nlu(self, data, status, content_type, content):
+        """Write a text2intent exchange to the capture store when recording"""
+        if self.capture is not None and self.capture.recording:
+            key = CaptureStore.nlu_key(self.get_t2i_url(), data)
+            self.capture.put('nlu', key, data, status, content_type, content)
+
+    def send_and_time_request(self, utterances, on_response=None):
+        """Send every utterance to text2intent and time each request.
+
+        Requests are sent over a keep-alive session by up to
+        `nlu_client.concurrency` workers. Responses and timings are
+        returned in input order, and `on_response(idx, response,
+        response_time)` is called as soon as the response for
+        utterances[idx] has been decoded. Utterances that normalize to the
+        same text are sent once. Utterances answered from the NLU
+        response cache, or by another utterance's request, are not timed;
+        their response_time is None.
+        A request that still fails after its retries gets a
+        failed_response() instead of aborting the batch.
+        """
+        utterances = list(utterances)
+        texts = [self.normalize_str(res) for res in utterances]
+        keys = [
+            NLUResponseCache.make_key(
+                text, self.get_id(), self.get_env(), self.get_version()
+            )
+            for text in texts
+        ]
+        # Utterances that normalize alike share one request
+        groups = {}
+        for idx, key in enumerate(keys):
+            groups.setdefault(key, []).append(idx)
+        cached = {key: self.nlu_cache.get(key) for key in groups}
+
+        # Requests are encoded up front to keep them off the workers
+        template = self.get_request_template()
+        uncached = [key for key, content in cached.items() if content is None]   # noqa
+        reqs = dict(zip(uncached, template.encode_batch(
+            [texts[groups[key][0]] for key in uncached]
+        )))
+
+        if reqs:
+            # Request to load model
+            req = template.encode("dummy")
+            self.post_with_retry(req)
+
+        def send(key):
+            content = cached[key]
+            response_time = None
+            if content is None:
+                try:
+                    resp, response_time = self.post_with_retry(reqs[key])
+                except requests.RequestException:
+                    resp = None
+                if resp is not None and resp.status_code == 200:
+                    content = resp.content
+                    self.nlu_cache.put(key, content)
+            elif self.capture is not None and self.capture.recording:
+                # Keep the capture complete for responses served from cache
+                self.record_nlu(
+                    template.encode(texts[groups[key][0]]), 200, None, content
+                )
+            out = []
+            for idx in groups[key]:
+                if content is None:
+                    # Retries ran out and the error body is no SlangResponsePB
+                    response = failed_response()
+                else:
+                    response = response_pb2dict(content)
+                response['text'] = utterances[idx]
+                response['entities'][0].pop('unrecognised_words', '')
+                if on_response is not None:
+                    on_response(idx, response, response_time)
+                out.append((idx, response, response_time))
+                # Only the utterance that made the request is timed
+                response_time = None
+            return out
+
+        pred_responses = [None] * len(utterances)
+        response_times = [None] * len(utterances)
+        with ThreadPoolExecutor(max_workers=self.get_nlu_concurrency()) as executor:   # noqa
+            results = executor.map(send, groups)
+            for group in tqdm(results, total=len(groups)):
+                for idx, response, response_time in group:
+                    pred_responses[idx] = response
+                    response_times[idx] = response_time
         return pred_responses, response_times
@@ -0,0 +1,108 @@
+from collections import namedtuple
+
+from rapidfuzz import process
+from rapidfuzz.distance import Levenshtein
+
+WERResult = namedtuple('WERResult', [
+    'wer',
+    'substitutions',
+    'deletions',
+    'insertions',
+    'reference_length',
+    'reference',
+    'hypothesis',
+])
+
+OP_NAMES = {'replace': 'S', 'delete': 'D', 'insert': 'I'}
+
+
+class WEREngine(object):
+    """Multi-reference WER over integer-encoded token sequences.
+
+    Tokens are interned into a vocabulary shared by everything scored
+    with the same engine (one per dataset), so references and hypotheses
+    are compared as tuples of ints. The edit distances of one hypothesis
+    against all its references are computed in a single `cdist` call and
+    only the best reference is aligned to get the error breakdown.
+    Results are memoized per (reference, hypothesis) pair, so repeated
+    pairs across engines and cohorts are scored once.
+    """
+
+    def __init__(self):
+        self.vocabulary = {}
+        self.tokens = []
+        self.memo = {}
+        self.alignments = {}
+
+    def encode(self, text):
+        ids = []
+        for token in text.split():
+            idx = self.vocabulary.get(token)
+            if idx is None:
+                idx = self.vocabulary[token] = len(self.tokens)
+                self.tokens.append(token)
+            ids.append(idx)
+        return tuple(ids)
+
+    def decode(self, ids):
+        return ' '.join(self.tokens[idx] for idx in ids)
+
+    def align(self, reference, hypothesis):
+        """Substitution, deletion and insertion counts of the best alignment"""
+        key = (reference, hypothesis)
+        if key not in self.alignments:
+            counts = {'replace': 0, 'delete': 0, 'insert': 0}
+            for op, _, _ in Levenshtein.editops(reference, hypothesis).as_list():   # noqa
+                counts[op] += 1
+            self.alignments[key] = (
+                counts['replace'], counts['delete'], counts['insert']
+            )
+        return self.alignments[key]
+
+    def score(self, hypothesis, references):
+        """WERResult of hypothesis against the closest of references.
+
+        Empty references are skipped. Raises ValueError if all of them are
+        empty, like jiwer does.
+        """
+        hyp = self.encode(hypothesis)
+        refs = []
+        for reference in references:
+            ref = self.encode(reference)
+            if ref and ref not in refs:
+                refs.append(ref)
+        if not refs:
+            raise ValueError("one or more references are empty strings")
+
+        pending = [ref for ref in refs if (ref, hyp) not in self.memo]
+        if pending:
+            distances = process.cdist(
+                [hyp], pending, scorer=Levenshtein.distance
+            )[0]
+            for ref, distance in zip(pending, distances):
+                self.memo[(ref, hyp)] = int(distance)
+
+        best = min(refs, key=lambda ref: self.memo[(ref, hyp)] / len(ref))
+        substitutions, deletions, insertions = self.align(best, hyp)
+        return WERResult(
+            wer=self.memo[(best, hyp)] / len(best),
+            substitutions=substitutions,
+            deletions=deletions,
+            insertions=insertions,
+            reference_length=len(best),
+            reference=best,
+            hypothesis=hyp,
+        )
+
+    def errors(self, reference, hypothesis):
+        """Word errors of the best alignment as (op, ref_word, hyp_word).
+
+        op is 'S', 'D' or 'I'; the missing side of a deletion or an
+        insertion is None.
+        """
+        out = []
+        for op, i, j in Levenshtein.editops(reference, hypothesis).as_list():
+            ref_word = self.tokens[reference[i]] if op != 'insert' else None
+            hyp_word = self.tokens[hypothesis[j]] if op != 'delete' else None
+            out.append((OP_NAMES[op], ref_word, hyp_word))
+        return out